@@ -6,188 +6,89 @@
 ###############################################################################
 
 # Import libraries
-import sys, os, re, glob, time
-import random, statistics
-import csv, pandas as pd
-import array, numpy as np
-from dtaidistance import dtw
+import time, argparse
+from anonym_meth1 import metrics
+from anonym_meth1.errors import exit_on_error
+from anonym_meth1.distance_cache import MAX_ENTRIES
+from anonym_meth1.results_file import RESULTS_FILE
+from anonym_meth1.prefetch import DEPTH_PER_THREAD
 
 
-""" Usage of arguments in bash command line """
-path_pr = sys.argv[1] # path of the original folder
-path_pa = sys.argv[2] # path of the anonymized folder
-path_analysis_anonym = sys.argv[3] # path of the analysis_anonym_meth1_<param1>_<value1>_<param2>_<value2> folder 
-filename_csv = sys.argv[4] # output : distri_dissim_norm_meth1_<param1>_<value1>_<param2>_<value2>.csv
-
-########################################################################################################################################################
-
-def get_random_pr_series(path_pr):
-    """ Return a list of 10 random files from the real "series" files
+def seed_value(value):
+    """ Type of the --seed options : the seeds of numpy are non-negative integers
     Argument:
-    path_real = path of the original folder (real patients, multivariate) """
-    
-    try:
-        list_pr = glob.glob(os.path.join(path_pr, "*.txt")) # Check files into the original folder 
-        list_pr_series = [] # Create an empty list that will only contains "series" files
-      
-        for files_pr in list_pr: 
-            if files_pr.endswith("_series.txt"):   # Keep only files that are finishing by "_series.txt"
-                list_pr_series.append(files_pr)  # If True, add the file to the list 
-            
-        list_pr_series.sort(key=lambda f: int(re.sub('\D', '', f))) # Sort the series' list by ascending order with lambda key & regular expression library   
-
-        random_pr_series = random.sample(list_pr_series, 10) # Pick 10 random files from the list (rand.seed() is placed in the "main" part)
+    value = text given on the command line """
 
-    except FileNotFoundError:
-        sys.stderr.write(f"[FileNotFoundError] Impossible to open the folder : {path_pr} \n")
-        exit(1)
-    
-    return random_pr_series
+    seed = int(value)
+    if seed < 0 :
+        raise argparse.ArgumentTypeError(f'the seed must be a non-negative integer, not {value}')
+    return seed
 
-########################################################################################################################################################
 
-def get_list_pa_series(path_pa):
-    """Return the list of 'series' files for anonymized patient 
+""" Usage of arguments in bash command line """
+def get_arguments(argv = None):
+    """ Return the parsed arguments of the command line
     Argument:
-    path_pa = path of anonymized folder """
-    
-    try:
-        list_pa_multi = glob.glob(os.path.join(path_pa, "*.txt")) # Check files into the anonymized folder 
-        list_pa_series = []
-     
-        for files_pa in list_pa_multi: 
-            if files_pa.endswith("_series.txt"):
-                list_pa_series.append(files_pa)
-            
-    except FileNotFoundError:
-        sys.stderr.write(f"[FileNotFoundError] Impossible to open the folder : {path_pa} \n")
-        exit(1)
-        
-    return list_pa_series
-
-#######################################################################################################################################################
-
-def DTWu_m_minimum(path_pr, path_pa, path_analysis_anonym):
-    """ Read series files, measure univariate DTW distances between each anonymized patients and 10 real patients 
-    (randomly chosen), then measure multivariate DTW disantces (mean of FC, PAS, PAM & PAD), and write in a  
-    temporary file all minimum DTWm
-    Arguments:
-    path_pr = path of the original folder def natural_sort(l): 
-    path_pa = path of anonymized folder 
-    path_analysis_anonym = path of the analysis_anonym_meth1 folder 
-    """
-    
-    list_pa_series = get_list_pa_series(path_pa) # Get anonymized patient series
-    list_pa_series.sort(key=lambda f: int(re.sub('\D', '', f))) # Sort the series' list by ascending order      
-    lists_dist_param, list_arrays, list_DTWm, DTWm_minimum = [], [], [], [] # Create lists for to store data of nested loops 
+    argv = list of arguments (default : sys.argv[1:]) """
     
-    # Create a file in the analysis_anonym_meth1 folder to temporary memorize minimum DTWm 
-    temp_DTWm_minimum = pd.DataFrame() # First, create a dataframe that will contains minimum DTWm
-    temp_DTWm_minimum.to_csv(f'{path_analysis_anonym}/temp_DTWm_minimum.txt', sep = ',', header=False, index=False) # Create the file (updated in next loop)
-   
-    # For the 1000 anonymized patients :
-    for pa in list_pa_series :
-        
-        list_dist_10_fc, list_10_dist_pas, list_10_dist_pam, list_10_dist_pad = [], [], [], [] # Need local variables here (not outside of the loop) 
-                                                                                                # in order to re-initialize them for each anonymized patient
-        # Read anonymized time series and transform pd.DataFrame into np.ndarray
-        pa_series_fc = (pd.read_csv(pa, usecols = [1])).to_numpy() # 1 : FC column (where [0] is for Time)
-        pa_series_pas = (pd.read_csv(pa, usecols = [2])).to_numpy() # 2 : PAS column 
-        pa_series_pam = (pd.read_csv(pa, usecols = [3])).to_numpy() # 3 : PAM column 
-        pa_series_pad = (pd.read_csv(pa, usecols = [4])).to_numpy() # 4 : PAD column 
-        
-        random_pr_10_series = get_random_pr_series(path_pr) # Get 10 random pr series for each pa series
-        
-        for i in random_pr_10_series :
-            # Read real time series
-            pr_series_fc = (pd.read_csv(i, usecols = [1])).to_numpy() # 1 : FC column 
-            pr_series_pas = (pd.read_csv(i, usecols = [2])).to_numpy() # 2 : PAS column  
-            pr_series_pam = (pd.read_csv(i, usecols = [3])).to_numpy() # 3 : PAM column 
-            pr_series_pad = (pd.read_csv(i, usecols = [4])).to_numpy() # 4 : PAD column 
-
-            # Measure univariate DTW distances between pa and pr
-            distance_fc = dtw.distance(array.array('d', pa_series_fc), array.array('d', pr_series_fc), use_c = True) # pa versus pr_1 (pr_1+1 for each turn)
-            list_dist_10_fc.append(distance_fc) # Add the distance to the list 
-            distance_pas = dtw.distance(array.array('d', pa_series_pas), array.array('d', pr_series_pas), use_c = True) 
-            list_10_dist_pas.append(distance_pas)
-            distance_pam = dtw.distance(array.array('d', pa_series_pam), array.array('d', pr_series_pam), use_c = True) 
-            list_10_dist_pam.append(distance_pam)
-            distance_pad = dtw.distance(array.array('d', pa_series_pad), array.array('d', pr_series_pad), use_c = True) 
-            list_10_dist_pad.append(distance_pad) 
-        
-        # Measure multivariate DTW 
-        lists_dist_param = [list_dist_10_fc, list_10_dist_pas, list_10_dist_pam, list_10_dist_pad] # Make a list of the four lists
-        list_arrays = [np.array(x) for x in lists_dist_param] # For each sublist, make np.arrays (e.g., [[2, 3], [4, 6]] --> to then compare 2 with 4 & 3 with 6)
-        list_DTWm = [np.mean(k) for k in zip(*list_arrays)] # Calculate the mean of each parameter distances (e.g., mean_of_dist_1)    
-        
-        # Memorize the minimum DTWm on the 10 real patients 
-        list_DTWm = sorted(list_DTWm, key = lambda x:float(x)) # Sort the list of strings in an ascendent order
-        DTWm_minimum.append(list_DTWm[0]) # Keep the first element of each sorted list_DTWm 
-        if ((len(DTWm_minimum)) == (len(list_pa_series))) :  # Once all minimum DTWm have been calculated, write them in the temp file 
-            with open(f'{path_analysis_anonym}/temp_DTWm_minimum.txt', 'a') as f:    # 'a' is for appending, quite optional here 
-                writer = csv.writer(f)      
-                writer.writerow(DTWm_minimum)
-    
-    return
-
-########################################################################################################################################################  
-
-def normalize_DTWm_min(path_analysis_anonym):
-    
-    """ Calculate the mean E and the standard error S from the temporary DTWm_minimum file 
-    and return each normalized dissimilarities (1000) into a csv file
-    Argument : 
-    path_analysis_anonym = path of the analysis_anonym_meth1 folder  
-    """
-
-    try :
-        # Find and read the temporary DTWm_minimum file
-        csv_file = glob.glob(os.path.join(path_analysis_anonym, "temp_DTWm_minimum.txt"))
-        for f in csv_file:
-            DTWm_minimum = (pd.read_csv(f)).columns.tolist() # Read the file and convert the type 'pandas.core.frame.DataFrame' into a list
-            
-    except IsADirectoryError:
-        sys.stderr.write(f"[IsADirectoryError] Is a directory: '{path_analysis_anonym}' \n")
-        exit(1)
-        
-    except FileNotFoundError :
-        sys.stderr.write(f"[FileNotFoundError] No such file or directory: 'temp_DTWm_minimum.txt', {path_analysis_anonym} \n")
-        exit(1)  
-        
-    try : 
-        DTWm_minimum = [float(items) for items in DTWm_minimum] # Convert the DTWm_minimum list of strings into a list of floats
-        mean_E = statistics.mean(DTWm_minimum) # Calculate the mean of all minimum DTWm
-        standev_S = statistics.stdev(DTWm_minimum) # Calculate the standard deviation of all minimum DTWm
-        DTWm_minimum_array = np.array(DTWm_minimum) # Convert the list of float into a numpy array
-        dissim_norm = (DTWm_minimum_array - mean_E)/standev_S # Calculate normalized dissimilarities
-        
-    except ValueError :
-        sys.stderr.write(f"[StatisticError] There is a problem in at least one statistics operation.\n")
-        exit(1)
-    
-    try :    
-        # Save normalized dissimilarities as a csv file (txt works too) with header 'dissim_norm' and delimiter ','
-        np.savetxt(f'{path_analysis_anonym}{filename_csv}', dissim_norm, delimiter = ',', header = "dissim_norm", fmt='%f', comments = '')
- 
-    except IOError :
-        sys.stderr.write(f"[IOError] No such file or directory : {path_analysis_anonym} \n")
-        exit(1)
+    parser = argparse.ArgumentParser(description = 'Measure normalized multivariate dissimilarities between original and anonymized patients.')
+    parser.add_argument('path_pr', help = 'path of the original folder')
+    parser.add_argument('path_pa', help = 'path of the anonymized folder')
+    parser.add_argument('path_analysis_anonym', help = 'path of the analysis_anonym_meth1_<param1>_<value1>_<param2>_<value2> folder')
+    parser.add_argument('filename_csv', help = 'output : distri_dissim_norm_meth1_<param1>_<value1>_<param2>_<value2>.csv')
+    parser.add_argument('--workers', type = int, default = 1, help = 'number of processes sharing the anonymized patients (default : 1)')
+    parser.add_argument('--seed', type = seed_value, default = None, help = 'seed of the run, each anonymized patient gets its own random stream derived from it and its ID (default : current time)')
+    parser.add_argument('--reference', choices = ['random', 'all', 'screened'], default = 'random', help = 'compare each anonymized patient with 10 random real patients (default), with all of them (exact nearest original) or with the top-k of a coarse DTW screening (approximate nearest original)')
+    parser.add_argument('--top-k', type = int, default = 20, metavar = 'K', help = 'with --reference screened, number of candidates refined at full resolution : larger is slower and more accurate (default : 20)')
+    parser.add_argument('--screening-recall', action = 'store_true', help = 'with --reference screened, measure the recall of the screening against the exact search on 100 anonymized patients')
+    parser.add_argument('--replicates', type = int, default = None, metavar = 'K', help = 'Monte Carlo mode : compute the full DTWm matrix once (cached in path_analysis_anonym) and draw K replicate sets of 10 random real patients')
+    parser.add_argument('--window', type = float, default = None, metavar = 'W', help = 'Sakoe-Chiba window of the DTW : a number of samples (W >= 1) or a fraction of the anonymized series length (0 < W < 1) (default : no window)')
+    parser.add_argument('--dtw-mode', choices = ['independent', 'dependent'], default = 'independent', help = 'multivariate DTW : mean of the four univariate DTW, each parameter with its own warping path (default), '
+                                                                                                           'or one DTW of the 4-dimensional FC/PAS/PAM/PAD series with a single warping path (about 4 times less DTW work)')
+    parser.add_argument('--channel-scale', choices = ['none', 'std'], default = 'none', help = 'with --dtw-mode dependent, divide each parameter by its standard deviation over the original patients before the DTW (default : none)')
+    parser.add_argument('--compare-modes', action = 'store_true', help = 'measure on 100 anonymized patients how the dependent DTW changes the minimum DTWm and the normalized dissimilarities compared with the independent one')
+    parser.add_argument('--max-dist', action = 'store_true', help = 'abandon the DTW computations of a pair as soon as they exceed the running minimum DTWm of the anonymized patient')
+    parser.add_argument('--dtw-cache', default = None, metavar = 'FILE', help = 'SQLite file caching the univariate DTW distances across runs (created if missing, default : no cache)')
+    parser.add_argument('--dtw-cache-size', type = int, default = MAX_ENTRIES, metavar = 'N', help = f'maximal number of cached distances, the least recently used ones are evicted beyond that (default : {MAX_ENTRIES})')
+    parser.add_argument('--io-threads', type = int, default = 0, metavar = 'N', help = 'read the series of the next anonymized patients (and their 10 random real patients) with N threads while the DTW of the current one runs, '
+                                                                                  'and parse the series files with N threads when a cohort store is built (default : 0, no read-ahead)')
+    parser.add_argument('--prefetch-depth', type = int, default = None, metavar = 'D', help = f'with --io-threads, maximal number of anonymized patients read ahead (default : {DEPTH_PER_THREAD} per I/O thread)')
+    parser.add_argument('--resume', action = 'store_true', help = 'keep the patients already written in the records file of a previous run with the same settings and only compute the others (without --seed, the seed of that run is used)')
+    parser.add_argument('--columnar', action = 'store_true', help = f'save the normalized dissimilarities and the settings of the run into the results file of the analysis folder ({RESULTS_FILE}) instead of filename_csv and its metadata file')
+    parser.add_argument('--compare-unconstrained', action = 'store_true', help = 'with --window, measure on 100 random pairs how the window changes the distances compared with unconstrained DTW')
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.replicates is not None and (args.replicates < 1 or args.reference != 'random'):
+        parser.error('--replicates K needs K >= 1 and cannot be combined with --reference all or screened')
+    if args.top_k < 1:
+        parser.error('--top-k K needs K >= 1')
+    if args.io_threads < 0 or (args.prefetch_depth is not None and args.prefetch_depth < 1):
+        parser.error('--io-threads N needs N >= 0 and --prefetch-depth D needs D >= 1')
+    if args.channel_scale != 'none' and args.dtw_mode != 'dependent' and not args.compare_modes:
+        parser.error('--channel-scale goes with --dtw-mode dependent (or --compare-modes)')
+    if args.window is not None and args.window <= 0:
+        parser.error('--window W needs W > 0')
+    if args.window is not None and args.window >= 1:
+        args.window = int(args.window)
+    return args
 
 ########################################################################################################################################################  
 
 def main():
     
-    random.seed(time.time()) # Generate seeds depending on time (as random as possible)
-    
-    print('BEGIN : Calculate the 1000 univariate, multivariate DTW distances and keep minimum DTWm distances into a temporary file. \n')
-    print('Note : This script takes around 1m20.')
-    DTWu_m_minimum(path_pr, path_pa, path_analysis_anonym) # Run the DTWu_m_minimum function
-
-    print('BEGIN : Calculate the distribution of the 1000 minimum DTWm. \n') 
-    normalize_DTWm_min(path_analysis_anonym) # Rn the normalize_DTWm_min function
-    
-    print('REMOVE : temporary file containing the 1000 minimum DTWm. \n')
-    os.remove(f'{path_analysis_anonym}/temp_DTWm_minimum.txt') # Suppress the temporary file from the analysis_anonym_meth1 folder
+    args = get_arguments()
+    seed = args.seed
+    if seed is None and args.resume and args.replicates is None : # Resume the interrupted run with its own seed
+        from anonym_meth1.records import records_file, records_seed
+        seed = records_seed(records_file(args.path_analysis_anonym, args.filename_csv))
+        if seed is not None :
+            print(f'RESUME : seed {seed} taken from the records file of the interrupted run. \n')
+    if seed is None :
+        seed = int(time.time()) # Without --seed, generate a seed depending on time (as random as possible)
+    print(f'SEED : {seed} (use --seed {seed} to reproduce this run) \n')
+    from anonym_meth1.part1 import run # The pipeline (pandas, scipy, dtaidistance) is only imported once the arguments are parsed
+    with exit_on_error(), metrics.instrumented('analysis_anonym_meth1_part1.py', args.metrics, args.profile):
+        run(args, seed)
     
     print('END OF : analysis_anonym_meth1_part1.py. \n') 
     
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+###############################################################################
+#  Programm keeping the original folder in memory and evaluating anonymized   #
+#    folders or uploaded arrays on request (part1, part2 & part3, local HTTP)  #
+###############################################################################
+
+# Import libraries
+import time, argparse
+from anonym_meth1.errors import exit_on_error
+from anonym_meth1.stat_tests import CORRECTIONS
+import analysis_anonym_meth1_part1 as part1
+
+
+""" Usage of arguments in bash command line """
+def get_arguments(argv = None):
+    """ Return the parsed arguments of the command line, and the remaining ones (DTW options of part1)
+    Argument:
+    argv = list of arguments (default : sys.argv[1:]) """
+
+    parser = argparse.ArgumentParser(description = 'Load the original folder once and evaluate anonymized folders or uploaded arrays on request '
+                                                   '(normalized dissimilarities and KS / Mann-Whitney U tests). DTW options of part1 (e.g., --reference all, --window 0.1) are accepted.')
+    parser.add_argument('path_pr', help = 'path of the original folder')
+    parser.add_argument('--host', default = '127.0.0.1', help = 'address of the service (default : 127.0.0.1, local machine only)')
+    parser.add_argument('--port', type = int, default = 8765, help = 'port of the service (default : 8765, 0 : any free port)')
+    parser.add_argument('--concurrency', type = int, default = 2, metavar = 'N', help = 'number of requests evaluated at the same time, the others wait (default : 2)')
+    parser.add_argument('--seed', type = part1.seed_value, default = None, help = 'seed of the 10 random real patients, unless a request gives its own (default : current time)')
+    parser.add_argument('--correction', choices = CORRECTIONS, default = 'holm', help = 'multiple-comparison correction of the p-values of a request (default : holm)')
+    args, part1_options = parser.parse_known_args(argv)
+    if args.concurrency < 1 :
+        parser.error('--concurrency N needs N >= 1')
+    return args, part1_options
+
+########################################################################################################################################################
+
+def main():
+
+    args, part1_options = get_arguments()
+    seed = args.seed if args.seed is not None else int(time.time())
+    # DTW settings of part1, checked as by part1 (the folders are given by each request)
+    part1_args = part1.get_arguments(['pr', 'pa', 'analysis', 'file.csv', '--seed', str(seed)] + part1_options)
+    print(f'SEED : {seed} (use --seed {seed} to reproduce the results of the requests without seed) \n')
+
+    from anonym_meth1.service import EvaluationService, serve # The pipeline (pandas, scipy, dtaidistance) is only imported once the arguments are parsed
+    settings = {'seed': seed, 'reference': part1_args.reference, 'window': part1_args.window, 'max_dist': part1_args.max_dist, 'top_k': part1_args.top_k,
+                'dtw_mode': part1_args.dtw_mode, 'channel_scale': part1_args.channel_scale}
+    with exit_on_error():
+        print(f'BEGIN : Load the original folder {args.path_pr}, the envelopes of its series and its statistical values. \n')
+        service = EvaluationService(args.path_pr, settings, args.correction, args.concurrency)
+        serve(service, args.host, args.port)
+    print('END OF : analysis_anonym_meth1_service.py. \n')
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+###############################################################################
+#   Programm running part1, part2 and part3 for several anonymized folders    #
+#  (pairs of proportion/perturbation levels) against the same original one    #
+###############################################################################
+
+# Import libraries
+import time, argparse
+from anonym_meth1 import metrics
+from anonym_meth1.errors import exit_on_error
+from anonym_meth1.results_file import RESULTS_FILE
+import analysis_anonym_meth1_part1 as part1
+
+
+""" Usage of arguments in bash command line """
+def get_arguments(argv = None):
+    """ Return the parsed arguments of the command line, and the remaining ones (passed to part1)
+    Argument:
+    argv = list of arguments (default : sys.argv[1:]) """
+
+    parser = argparse.ArgumentParser(description = 'Run part1, part2 and part3 for several pairs of proportion/perturbation levels against the same original folder. '
+                                                   'Unknown options (e.g., --window 0.1, --workers 4) are passed to part1.')
+    parser.add_argument('path_pr', help = 'path of the original folder')
+    parser.add_argument('path_root', help = 'folder containing the anonymized folders (gener_simulated_data_meth1_prop-level_<prop>_perturb-level_<perturb>), '
+                                            'where the analysis folders and the combined table are written')
+    parser.add_argument('--prop', nargs = '+', default = [], metavar = 'P', help = 'proportion levels of the grid (e.g., 0.25 0.50)')
+    parser.add_argument('--perturb', nargs = '+', default = [], metavar = 'Q', help = 'perturbation levels of the grid (e.g., 0.05 0.25)')
+    parser.add_argument('--folders', nargs = '+', default = [], metavar = 'FOLDER', help = 'anonymized folders, whose names contain prop-level_<prop>_perturb-level_<perturb> (instead of or in addition to the grid)')
+    parser.add_argument('--sweep-workers', type = int, default = 1, metavar = 'N', help = 'number of configurations run at the same time, each one on one core (default : 1, '
+                                                                                    'the --workers option of part1 then shares the anonymized patients of each configuration)')
+    parser.add_argument('--seed', type = part1.seed_value, default = None, help = 'seed of part1, the same for all the configurations (default : current time)')
+    parser.add_argument('--columnar', action = 'store_true', help = f'save the results of each configuration into one file of its analysis folder ({RESULTS_FILE}) instead of about 30 csv files')
+    metrics.add_arguments(parser)
+    args, part1_options = parser.parse_known_args(argv)
+    if bool(args.prop) != bool(args.perturb):
+        parser.error('--prop and --perturb go together')
+    if not args.folders and not args.prop:
+        parser.error('give the configurations with --prop and --perturb, or with --folders')
+    if args.sweep_workers < 1:
+        parser.error('--sweep-workers N needs N >= 1')
+    part1_workers = argparse.ArgumentParser(add_help = False)
+    part1_workers.add_argument('--workers', type = int, default = 1)
+    if args.sweep_workers > 1 and part1_workers.parse_known_args(part1_options)[0].workers > 1: # The processes of the sweep cannot start processes of their own
+        parser.error('--workers of part1 goes with --sweep-workers 1')
+    return args, part1_options
+
+########################################################################################################################################################
+
+def main():
+
+    args, part1_options = get_arguments()
+    seed = args.seed if args.seed is not None else int(time.time())
+    # Options of part1 for all the configurations (checked before the first one, the folders and the output file are set for each configuration)
+    part1_args = part1.get_arguments(['pr', 'pa', 'analysis', 'file.csv', '--seed', str(seed)] + part1_options)
+    print(f'SEED : {seed} (use --seed {seed} to reproduce this sweep) \n')
+
+    from anonym_meth1.sweep import get_configurations, run_sweep # The pipeline (pandas, scipy, dtaidistance) is only imported once the arguments are parsed
+    with exit_on_error():
+        configurations = get_configurations(args.path_root, args.prop, args.perturb, args.folders)
+        with metrics.instrumented('analysis_anonym_meth1_sweep.py', args.metrics, args.profile):
+            run_sweep(args.path_pr, args.path_root, configurations, seed, part1_args, args.sweep_workers, args.columnar)
+    print('END OF : analysis_anonym_meth1_sweep.py. \n')
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,51 @@
+""" Shared building blocks of the analysis_anonym_meth1_part[1-3].py scripts, and their functions as a library :
+
+    import anonym_meth1 as meth1
+    list_pr_series, list_pa_series = meth1.get_list_series(path_pr, path_pa)
+    records = meth1.DTWu_m_minimum(path_pr, path_pa, meth1.records_file(path_analysis_anonym, filename_csv), seed)
+    dissim_norm = meth1.normalize_DTWm_min(path_analysis_anonym, filename_csv)
+    stats_pa, stats_pr = meth1.calculate_values(path_pr, path_pa, path_analysis_anonym, val_prop, val_perturb)
+    results = meth1.tests_KS_WMW_up(path_analysis_anonym, param_physio, val_prop, val_perturb)
+
+The functions are imported from their module at first use : importing the package loads neither pandas, scipy nor dtaidistance.
+Errors are raised as AnalysisError (the scripts print them and exit with status 1). """
+
+import importlib
+
+# Public functions and classes of the package --> module defining them
+API = {
+    # Part1 : minimum DTWm and normalized dissimilarities
+    'get_list_pa_series': 'part1', 'DTWu_m_minimum': 'part1', 'DTWm_replicates': 'part1', 'normalize_DTWm_min': 'part1',
+    'normalized_dissimilarities': 'part1',
+    # Part2 : statistical values
+    'get_list_series': 'part2', 'original_statistics': 'part2', 'calculate_values': 'part2',
+    # Part3 : statistical tests
+    'tests_KS_WMW_up': 'part3', 'tests_batch': 'part3', 'export_folders': 'part3',
+    # Sweep of several configurations
+    'get_configurations': 'sweep', 'run_sweep': 'sweep',
+    # Resident evaluation service
+    'EvaluationService': 'service', 'uploaded_store': 'service', 'serve': 'service',
+    # Building blocks working on arrays
+    'load_cohort': 'cohort_store', 'CohortStore': 'cohort_store', 'CHANNELS': 'cohort_store',
+    'segment_statistics': 'series_stats', 'cohort_statistics': 'series_stats', 'STATISTICS': 'series_stats',
+    'streaming_statistics': 'streaming_stats', 'batched_tests': 'stat_tests', 'test_table': 'stat_tests', 'adjust_pvalues': 'stat_tests',
+    'records_file': 'records', 'read_DTWm_minimum': 'records', 'read_results': 'results_file',
+    'distance_block': 'dtw_engine', 'compare_modes': 'dtw_engine', 'DTW_MODES': 'dtw_engine',
+    'generate_cohort': 'synthetic', 'AnalysisError': 'errors',
+}
+
+__all__ = list(API)
+
+
+def __getattr__(name):
+    """ Import the module of a public name at its first use """
+
+    if name not in API:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'{__name__}.{API[name]}'), name)
+    globals()[name] = value # Found directly at the next use
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(API))
@@ -0,0 +1,248 @@
+#################################################################################
+# Binary cohort store : parse a folder of "_series.txt" files once and keep it #
+#      as one contiguous float64 array per channel (memory-mapped .npy)        #
+#################################################################################
+
+# Import libraries
+import sys, os, re, glob, json, shutil, hashlib, tempfile, threading, contextlib
+import numpy as np
+try:
+    import fcntl
+except ImportError: # Windows : the rebuilds of a store are only serialised between the threads of a process
+    fcntl = None
+# pandas is imported by the functions using it, so that the scripts start fast (--help, parsing of the arguments)
+from anonym_meth1 import metrics
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.prefetch import Prefetcher
+
+
+CHANNELS = ('FC', 'PAS', 'PAM', 'PAD') # Physiological parameters stored for each patient (columns 1 to 4, column 0 is Time)
+STORE_DIRNAME = '.cohort_store' # Store folder, created inside the series folder
+STORE_VERSION = 1
+
+# Lock of each store folder, serialising its (re)builds between the threads of this process (e.g., requests of the evaluation service)
+_store_locks, _store_locks_guard = {}, threading.Lock()
+
+########################################################################################################################################################
+
+def list_series_files(path_series):
+    """ Return the list of 'series' files of a folder, sorted by ascending order (same order as the analysis scripts)
+    Argument:
+    path_series = path of the original or anonymized folder """
+
+    list_series = [f for f in glob.glob(os.path.join(path_series, "*.txt")) if f.endswith("_series.txt")]
+    list_series.sort(key = lambda f: int(re.sub(r'\D', '', f))) # Sort the series' list by ascending order
+    return list_series
+
+
+def patient_id(file_series):
+    """ Return the patient number of a 'series' file (digits of its basename, e.g. '12_series.txt' --> 12)
+    Argument:
+    file_series = path of a 'series' file """
+
+    digits = re.sub(r'\D', '', os.path.basename(file_series))
+    return int(digits) if digits else -1
+
+
+def read_series_file(file_series):
+    """ Parse one 'series' file and return a (length, 4) float64 array (FC, PAS, PAM & PAD columns)
+    Argument:
+    file_series = path of a 'series' file """
+
+    import pandas as pd
+    try:
+        df_series = pd.read_csv(file_series)
+        missing = [c for c in CHANNELS if c not in df_series.columns]
+        if missing:
+            raise AnalysisError('ValueError', f"Missing column(s) {missing} in {file_series}")
+        return df_series[list(CHANNELS)].to_numpy(dtype = np.float64)
+    except ValueError as e: # Malformed file or non-numeric values (pandas parser errors are ValueError too)
+        raise AnalysisError('ValueError', f"Unreadable values in {file_series} ({e})")
+
+########################################################################################################################################################
+
+class CohortStore:
+    """ Read-only view of a cohort : one contiguous array per channel and an offset table per patient.
+    Patient i owns the samples offsets[i]:offsets[i + 1] of every channel array. """
+
+    def __init__(self, path_series, files, offsets, channels, store_dir = None, signatures = None):
+        self.path_series = path_series
+        self.files = list(files) # Source 'series' files, in the order of the analysis scripts
+        self.signatures = signatures if signatures is not None else [_file_signature(f) for f in self.files] # (name, size, mtime) of each file
+        self.ids = np.array([patient_id(f) for f in self.files], dtype = np.int64)
+        self.offsets = offsets
+        self.channels = channels # Dictionary : channel name --> contiguous float64 array (np.memmap when stored on disk)
+        self.store_dir = store_dir
+
+    def __len__(self):
+        return len(self.files)
+
+    def lengths(self):
+        """ Return the number of samples of each patient """
+        return np.diff(self.offsets)
+
+    def series(self, i, channel):
+        """ Return the series of patient i for one channel (a view, no copy) """
+        return self.channels[channel][self.offsets[i]:self.offsets[i + 1]]
+
+    def patient(self, i):
+        """ Return the four series of patient i as a tuple of 1D arrays (FC, PAS, PAM, PAD) """
+        return tuple(self.series(i, c) for c in CHANNELS)
+
+    def fingerprint(self):
+        """ Return a short hash of the source files (names, sizes and modification times), used to name cached results """
+        return hashlib.sha1(json.dumps(self.signatures).encode()).hexdigest()[:16]
+
+########################################################################################################################################################
+
+def _file_signature(file_series):
+    """ Return the (name, size, mtime) signature used to detect modified source files """
+    st = os.stat(file_series)
+    return {'name': os.path.basename(file_series), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _read_manifest(store_dir):
+    """ Return the manifest of an existing store, or None if there is no (readable) store """
+    try:
+        with open(os.path.join(store_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, NotADirectoryError, ValueError):
+        return None
+    if manifest.get('version') != STORE_VERSION or tuple(manifest.get('channels', ())) != CHANNELS:
+        return None
+    return manifest
+
+
+def _open_store(path_series, files, store_dir, signatures = None):
+    """ Memory-map the arrays of an up-to-date store """
+    offsets = np.load(os.path.join(store_dir, 'offsets.npy'))
+    # Copy-on-write mapping : the files are never modified, but the buffers are writable as required by the typed memoryviews of dtaidistance
+    channels = {c: np.load(os.path.join(store_dir, f'{c}.npy'), mmap_mode = 'c') for c in CHANNELS}
+    return CohortStore(path_series, files, offsets, channels, store_dir, signatures)
+
+
+def _build_arrays(files, signatures, previous, io_threads = 0):
+    """ Parse the source files and concatenate them channel by channel.
+    Files whose signature is unchanged since the previous store are copied from it instead of being parsed again.
+    With io_threads, the files are parsed by a pool of threads ahead of the concatenation (see anonym_meth1.prefetch). """
+
+    reusable, old_store = {}, None
+    if previous is not None:
+        old_manifest, old_store = previous
+        for k, sig in enumerate(old_manifest['files']):
+            reusable[(sig['name'], sig['size'], sig['mtime_ns'])] = k
+
+    to_parse = [f for f, sig in zip(files, signatures) if (sig['name'], sig['size'], sig['mtime_ns']) not in reusable]
+    parsed = iter(Prefetcher(read_series_file, to_parse, io_threads)) if io_threads > 0 else ((f, read_series_file(f)) for f in to_parse)
+    blocks, n_parsed = [], 0
+    for f, sig in zip(files, signatures):
+        k = reusable.get((sig['name'], sig['size'], sig['mtime_ns']))
+        if k is not None:
+            blocks.append(np.column_stack([old_store.series(k, c) for c in CHANNELS]))
+        else:
+            blocks.append(next(parsed)[1]) # Parsed in the order of the files
+            n_parsed += 1
+            metrics.count('files_read')
+            metrics.count('bytes_read', sig['size'])
+
+    lengths = np.array([len(b) for b in blocks], dtype = np.int64)
+    offsets = np.zeros(len(blocks) + 1, dtype = np.int64)
+    np.cumsum(lengths, out = offsets[1:])
+    channels = {}
+    for j, c in enumerate(CHANNELS):
+        channels[c] = np.empty(offsets[-1], dtype = np.float64)
+        for b, start, stop in zip(blocks, offsets[:-1], offsets[1:]):
+            channels[c][start:stop] = b[:, j]
+    return offsets, channels, n_parsed
+
+
+@contextlib.contextmanager
+def _store_lock(store_dir):
+    """ Serialise the (re)builds of a store : between threads (one lock per store folder) and between processes (lock file next to the store) """
+
+    with _store_locks_guard:
+        lock = _store_locks.setdefault(os.path.abspath(store_dir), threading.Lock())
+    with lock:
+        lock_file = None
+        if fcntl is not None:
+            try:
+                lock_file = open(f'{store_dir}.lock', 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except OSError: # e.g., read-only dataset folder : no other process can write the store either
+                lock_file = None
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close() # Releases the lock file
+
+
+def _up_to_date_store(path_series, files, store_dir, signatures):
+    """ Return the store of these source files if it exists and is up to date, else None """
+
+    manifest = _read_manifest(store_dir)
+    if manifest is None or manifest['files'] != signatures:
+        return None
+    try:
+        return _open_store(path_series, files, store_dir, signatures)
+    except (FileNotFoundError, ValueError): # Swapped by another process while being opened
+        return None
+
+
+def _write_store(store_dir, offsets, channels, manifest):
+    """ Write a new store into a folder of its own next to the old one and swap them, so that readers never see a half-written store
+    (called with the lock of the store, see _store_lock) """
+
+    tmp_dir = tempfile.mkdtemp(prefix = f'{os.path.basename(store_dir)}.tmp-', dir = os.path.dirname(os.path.abspath(store_dir)))
+    try:
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+        for c in CHANNELS:
+            np.save(os.path.join(tmp_dir, f'{c}.npy'), channels[c])
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f: # Written last : a store without manifest is ignored
+            json.dump(manifest, f)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+        raise
+
+    old_dir = f'{tmp_dir}.old'
+    if os.path.isdir(store_dir):
+        os.rename(store_dir, old_dir)
+    os.rename(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors = True)
+
+
+def load_cohort(path_series, list_series = None, store_dir = None, io_threads = 0):
+    """ Return the CohortStore of a folder, (re)building its binary store if the source files changed
+    Arguments:
+    path_series = path of the original or anonymized folder
+    list_series = sorted list of 'series' files to store (default : all '_series.txt' files of the folder)
+    store_dir = folder of the binary store (default : <path_series>/.cohort_store)
+    io_threads = number of threads parsing the series files when the store is (re)built (0 : one file after the other) """
+
+    if list_series is None:
+        list_series = list_series_files(path_series)
+    if store_dir is None:
+        store_dir = os.path.join(path_series, STORE_DIRNAME)
+
+    signatures = [_file_signature(f) for f in list_series]
+    store = _up_to_date_store(path_series, list_series, store_dir, signatures)
+    if store is not None:
+        return store # Up to date : nothing is parsed
+
+    with _store_lock(store_dir): # One (re)build at a time : the others wait for it and open its store
+        store = _up_to_date_store(path_series, list_series, store_dir, signatures)
+        if store is not None:
+            return store
+        manifest, previous = _read_manifest(store_dir), None
+        if manifest is not None:
+            previous = (manifest, _open_store(path_series, [os.path.join(path_series, s['name']) for s in manifest['files']], store_dir, manifest['files']))
+        offsets, channels, n_parsed = _build_arrays(list_series, signatures, previous, io_threads)
+        print(f'STORE : {n_parsed} of {len(list_series)} series files parsed for {path_series}')
+
+        try:
+            _write_store(store_dir, offsets, channels, {'version': STORE_VERSION, 'channels': list(CHANNELS), 'files': signatures})
+        except OSError as e: # e.g., read-only dataset folder : keep the parsed arrays in memory for this run
+            sys.stderr.write(f"[OSError] Impossible to write the cohort store {store_dir} ({e}), it is kept in memory. \n")
+            return CohortStore(path_series, list_series, offsets, channels, signatures = signatures)
+
+        return _open_store(path_series, list_series, store_dir, signatures) # Opened once the swap is complete
@@ -0,0 +1,91 @@
+###############################################################################
+# Persistent cache of univariate DTW distances : one SQLite table indexed by #
+#  the content hashes of both series, the channel and the DTW settings      #
+###############################################################################
+
+# Import libraries
+import json, time, hashlib, sqlite3
+import numpy as np
+# dtaidistance (its version is part of the keys) is imported by pair_keys, so that the scripts start fast (--help, parsing of the arguments)
+
+# Default maximal number of cached distances (about 40 bytes each on disk), the least recently used ones are evicted beyond that
+MAX_ENTRIES = 5000000
+
+# Number of keys of one SELECT (below the SQLite limit of variables per statement)
+QUERY_SIZE = 500
+
+########################################################################################################################################################
+
+def series_digest(series):
+    """ Return the 16-byte content hash of a series (float64 values)
+    Argument:
+    series = 1D array """
+
+    return hashlib.blake2b(np.ascontiguousarray(series, dtype = np.float64).tobytes(), digest_size = 16).digest()
+
+
+class DistanceCache:
+    """ On-disk cache of univariate DTW distances. A distance is found again whatever the files, the folders or the seed of the run,
+    as long as the two series, the channel and the DTW settings are the same. Several processes can share the same file. """
+
+    def __init__(self, file, max_entries = MAX_ENTRIES):
+        self.file = file
+        self.max_entries = max_entries
+        self.hits, self.misses = 0, 0
+        self.db = sqlite3.connect(file, timeout = 60)
+        self.db.execute('PRAGMA journal_mode = WAL') # Readers do not block the writer (worker processes)
+        self.db.execute('CREATE TABLE IF NOT EXISTS distances (key BLOB PRIMARY KEY, distance REAL NOT NULL, last_used INTEGER NOT NULL) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS distances_last_used ON distances (last_used)')
+        self.db.commit()
+
+    def pair_keys(self, pa_series, pr_series, channel, dtw_settings):
+        """ Return the (len(pa_series), len(pr_series)) nested list of keys of the pairs of one channel
+        Arguments:
+        pa_series, pr_series = lists of 1D arrays
+        channel = name of the channel
+        dtw_settings = dtaidistance settings of the distances (absolute window, ...) """
+
+        import dtaidistance
+        settings = json.dumps([channel, dtaidistance.__version__, dtw_settings], sort_keys = True).encode()
+        pr_digests = [series_digest(s) for s in pr_series]
+        keys = []
+        for q in pa_series:
+            pa_digest = series_digest(q)
+            keys.append([hashlib.blake2b(pa_digest + d + settings, digest_size = 16).digest() for d in pr_digests])
+        return keys
+
+    def get(self, keys):
+        """ Return the array of cached distances of a list of keys (nan when missing), and mark the found ones as recently used """
+
+        found = {}
+        for i in range(0, len(keys), QUERY_SIZE):
+            chunk = keys[i:i + QUERY_SIZE]
+            found.update(self.db.execute(f'SELECT key, distance FROM distances WHERE key IN ({",".join("?" * len(chunk))})', chunk).fetchall())
+        if found:
+            self.db.executemany('UPDATE distances SET last_used = ? WHERE key = ?', [(time.time_ns(), k) for k in found])
+            self.db.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return np.array([found.get(k, np.nan) for k in keys], dtype = np.float64)
+
+    def put(self, keys, distances):
+        """ Save the distances of a list of keys """
+
+        now = time.time_ns()
+        self.db.executemany('INSERT OR REPLACE INTO distances VALUES (?, ?, ?)', [(k, float(d), now) for k, d in zip(keys, distances)])
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM distances').fetchone()[0]
+
+    def evict(self):
+        """ Delete the least recently used distances beyond max_entries, return their number """
+
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self.db.execute('DELETE FROM distances WHERE key IN (SELECT key FROM distances ORDER BY last_used LIMIT ?)', (excess,))
+            self.db.commit()
+        return max(excess, 0)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,220 @@
+###############################################################################
+# Batched DTW engine : univariate DTW distances between a block of anonymized #
+#   series and a block of original series, computed in one native call       #
+###############################################################################
+
+# Import libraries
+import time
+import numpy as np
+from dtaidistance import dtw, dtw_ndim
+
+from anonym_meth1 import metrics
+from anonym_meth1.cohort_store import CHANNELS
+
+# Multivariate DTW : mean of the four univariate DTW, each channel with its own warping path (independent), 
+# or one DTW of the 4-dimensional (FC, PAS, PAM, PAD) series, with a single warping path (dependent)
+DTW_MODES = ('independent', 'dependent')
+
+# Scaling of the channels before the dependent DTW : none, or division by the standard deviation of the channel over the original cohort
+CHANNEL_SCALES = ('none', 'std')
+
+########################################################################################################################################################
+
+def absolute_window(window, length):
+    """ Return the Sakoe-Chiba window in samples (dtaidistance convention : maximal shift from the diagonals, 1 = Euclidean-like)
+    Arguments:
+    window = None (no band), a number of samples (>= 1) or a fraction of length (0 < window < 1)
+    length = length of the anonymized series """
+
+    if window is None:
+        return None
+    if window < 1:
+        return max(1, int(np.ceil(window * length)))
+    return int(window)
+
+
+def channel_scales(store_pr, channel_scale = 'none'):
+    """ Return the 4 factors dividing the channels (FC, PAS, PAM, PAD) of every series before the dependent DTW
+    Arguments:
+    store_pr = cohort store of the original folder
+    channel_scale = 'none' (factors 1) or 'std' (standard deviation of each channel over all the original values) """
+
+    if channel_scale == 'none':
+        return np.ones(len(CHANNELS))
+    scales = np.array([np.std(store_pr.channels[c]) for c in CHANNELS])
+    return np.where(scales > 0, scales, 1.0) # A constant channel is left as it is
+
+
+def stacked_patient(patient, scales = None):
+    """ Return the (length, 4) C-contiguous array of the 4 series of a patient (input of the dependent DTW)
+    Arguments:
+    patient = tuple of the 4 series (see CohortStore.patient)
+    scales = factors dividing the channels (see channel_scales, None : no scaling) """
+
+    values = np.column_stack(patient).astype(np.float64)
+    if scales is not None:
+        values /= scales
+    return values
+
+
+def channel_distance_block(pa_series, pr_series, parallel = True, **dtw_settings):
+    """ Return the (len(pa_series), len(pr_series)) array of univariate DTW distances for one channel, or of the DTW distances of
+    4-dimensional series when the series are (length, 4) arrays (see stacked_patient).
+    The whole block is computed by a single dtaidistance C call (same kernel as dtw.distance(..., use_c = True) or dtw_ndim.distance).
+    Arguments:
+    pa_series = list of 1D arrays (anonymized series of one channel) or of (length, 4) arrays
+    pr_series = list of 1D arrays (original series of the same channel) or of (length, 4) arrays
+    parallel = use the OpenMP threads of dtaidistance
+    dtw_settings = other dtaidistance settings (window, max_dist, ...) """
+
+    n_pa, n_pr = len(pa_series), len(pr_series)
+    if n_pa == 0 or n_pr == 0:
+        return np.empty((n_pa, n_pr))
+
+    series = [np.ascontiguousarray(s, dtype = np.float64) for s in pa_series] + [np.ascontiguousarray(s, dtype = np.float64) for s in pr_series]
+    kernel = dtw_ndim if series[0].ndim == 2 else dtw # One DP over the 4-dimensional points (squared Euclidean cost of a cell) or univariate DP
+    block = kernel.distance_matrix_fast(series, block = ((0, n_pa), (n_pa, n_pa + n_pr)), compact = True, parallel = parallel, **dtw_settings)
+    if metrics.current() is not None:
+        metrics.count('dtw_calls', n_pa * n_pr)
+        metrics.count('dtw_cells', metrics.dtw_cells(np.array([len(s) for s in pa_series])[:, None], np.array([len(s) for s in pr_series])[None, :], dtw_settings.get('window')))
+    return np.asarray(block, dtype = np.float64).reshape(n_pa, n_pr) # Compact output = block values, row by row
+
+
+def cached_channel_block(pa_series, pr_series, channel, cache, parallel = True, **dtw_settings):
+    """ Return the same array as channel_distance_block, reading the distances already known from the cache and saving the
+    computed ones into it
+    Arguments:
+    pa_series, pr_series = lists of 1D arrays (anonymized and original series of one channel), or of (length, 4) arrays
+    channel = name of the channel ('dependent' for 4-dimensional series)
+    cache = DistanceCache (see anonym_meth1.distance_cache)
+    parallel = use the OpenMP threads of dtaidistance
+    dtw_settings = other dtaidistance settings (window, ...) """
+
+    n_pa, n_pr = len(pa_series), len(pr_series)
+    keys = cache.pair_keys(pa_series, pr_series, channel, dtw_settings)
+    block = cache.get([k for row in keys for k in row]).reshape(n_pa, n_pr)
+    missing = np.isnan(block)
+    if missing.all(): # Nothing known : the whole block in one native call
+        block = channel_distance_block(pa_series, pr_series, parallel = parallel, **dtw_settings)
+    else:
+        for i in np.flatnonzero(missing.any(axis = 1)): # Only the missing pairs of each anonymized series
+            columns = np.flatnonzero(missing[i])
+            block[i, columns] = channel_distance_block([pa_series[i]], [pr_series[j] for j in columns], parallel = parallel, **dtw_settings)[0]
+    rows, columns = np.nonzero(missing)
+    if len(rows) > 0:
+        cache.put([keys[i][j] for i, j in zip(rows, columns)], block[rows, columns])
+    return block
+
+
+def distance_block(pa_patients, pr_patients, parallel = True, window = None, cache = None, mode = 'independent', scales = None, **dtw_settings):
+    """ Return the (4, n_pa, n_pr) array of univariate DTW distances (FC, PAS, PAM & PAD) between two blocks of patients, 
+    or with mode = 'dependent' the (1, n_pa, n_pr) array of the DTW distances of their 4-dimensional series
+    Arguments:
+    pa_patients = list of anonymized patients, each one a tuple of 4 series (see CohortStore.patient)
+    pr_patients = list of original patients, each one a tuple of 4 series
+    parallel = use the OpenMP threads of dtaidistance
+    window = Sakoe-Chiba window, in samples or as a fraction of the anonymized series length (see absolute_window)
+    cache = DistanceCache checked before computing a distance (None : no cache)
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling)
+    dtw_settings = other dtaidistance settings (max_dist, psi, ...) """
+
+    if window is not None and window < 1 and len(pa_patients) > 1: # Relative window : one block per anonymized patient
+        return np.concatenate([distance_block([p], pr_patients, parallel, window, cache, mode, scales, **dtw_settings) for p in pa_patients], axis = 1)
+    if window is not None and len(pa_patients) > 0:
+        dtw_settings['window'] = absolute_window(window, len(pa_patients[0][0]))
+
+    if mode == 'dependent': # One DP per pair instead of four
+        pa_series, pr_series = [stacked_patient(p, scales) for p in pa_patients], [stacked_patient(p, scales) for p in pr_patients]
+        if cache is not None and len(pa_series) > 0 and len(pr_series) > 0:
+            return cached_channel_block(pa_series, pr_series, 'dependent', cache, parallel = parallel, **dtw_settings)[None]
+        return channel_distance_block(pa_series, pr_series, parallel = parallel, **dtw_settings)[None]
+
+    distances = np.empty((len(CHANNELS), len(pa_patients), len(pr_patients)))
+    for c, channel in enumerate(CHANNELS):
+        pa_series, pr_series = [p[c] for p in pa_patients], [p[c] for p in pr_patients]
+        if cache is not None and len(pa_series) > 0 and len(pr_series) > 0:
+            distances[c] = cached_channel_block(pa_series, pr_series, channel, cache, parallel = parallel, **dtw_settings)
+        else:
+            distances[c] = channel_distance_block(pa_series, pr_series, parallel = parallel, **dtw_settings)
+    return distances
+
+########################################################################################################################################################
+
+def DTWm_block(distances):
+    """ Return the (n_pa, n_pr) multivariate DTW distances : mean of the four univariate distances of each pair
+    (the dependent distance itself with a (1, n_pa, n_pr) array)
+    Argument:
+    distances = (4, n_pa, n_pr) or (1, n_pa, n_pr) array returned by distance_block """
+
+    return distances.mean(axis = 0) # Same summation order as np.mean over the four distances of one pair
+
+
+def minimum_DTWm(distances):
+    """ Return, for each anonymized patient (row), the minimum multivariate DTW distance over the original patients
+    Argument:
+    distances = (4, n_pa, n_pr) or (1, n_pa, n_pr) array returned by distance_block """
+
+    return DTWm_block(distances).min(axis = 1)
+
+########################################################################################################################################################
+
+def compare_window(store_pa, store_pr, window, n_pairs = 100, seed = 0):
+    """ Return a dictionary describing how a Sakoe-Chiba window changes the univariate DTW distances of n_pairs random
+    (anonymized, original) pairs, compared with unconstrained DTW (a band can only increase a distance)
+    Arguments:
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    window = Sakoe-Chiba window (see absolute_window)
+    n_pairs = number of random pairs
+    seed = seed of the drawn pairs """
+
+    rng = np.random.default_rng(seed)
+    pairs = zip(rng.integers(len(store_pa), size = n_pairs), rng.integers(len(store_pr), size = n_pairs))
+    free, banded = [], []
+    for pa, pr in pairs:
+        free.append(distance_block([store_pa.patient(pa)], [store_pr.patient(pr)])[:, 0, 0])
+        banded.append(distance_block([store_pa.patient(pa)], [store_pr.patient(pr)], window = window)[:, 0, 0])
+    free, banded = np.array(free), np.array(banded) # Shape (n_pairs, 4)
+    ratio = banded / np.where(free > 0, free, 1.0)
+    DTWm_free, DTWm_banded = free.mean(axis = 1), banded.mean(axis = 1)
+    return {'n_pairs': n_pairs, 'window': window,
+            'unchanged_distances': float(np.mean(np.isclose(banded, free))), # Share of univariate distances left unchanged by the band
+            'mean_ratio': float(ratio.mean()), 'max_ratio': float(ratio.max()), # Banded / unconstrained distance
+            'ratio_per_channel': dict(zip(CHANNELS, ratio.mean(axis = 0).tolist())),
+            'DTWm_rank_correlation': float(np.corrcoef(np.argsort(np.argsort(DTWm_free)), np.argsort(np.argsort(DTWm_banded)))[0, 1])}
+
+
+def compare_modes(store_pa, store_pr, scales, window = None, n_patients = 100, seed = 0):
+    """ Return a dictionary comparing the independent and the dependent multivariate DTW on n_patients anonymized patients drawn at random,
+    each one against 10 random original patients (the same ones for both modes) : duration of each mode, share of patients with the same
+    nearest original, rank correlation of the minimum DTWm and difference of the distributions of normalized dissimilarities (quantiles, KS test)
+    Arguments:
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    scales = factors dividing the channels before the dependent DTW (see channel_scales)
+    window = Sakoe-Chiba window (see absolute_window)
+    n_patients = number of anonymized patients
+    seed = seed of the drawn patients """
+
+    from scipy.stats import ks_2samp
+    rng = np.random.default_rng(seed)
+    patients = rng.choice(len(store_pa), size = min(n_patients, len(store_pa)), replace = False)
+    minima, nearest, durations = {m: [] for m in DTW_MODES}, {m: [] for m in DTW_MODES}, dict.fromkeys(DTW_MODES, 0.0)
+    for pa in patients:
+        originals = [store_pr.patient(pr) for pr in rng.choice(len(store_pr), size = min(10, len(store_pr)), replace = False)]
+        for mode in DTW_MODES:
+            start = time.perf_counter()
+            list_DTWm = DTWm_block(distance_block([store_pa.patient(pa)], originals, window = window, mode = mode, scales = scales))[0]
+            durations[mode] += time.perf_counter() - start
+            minima[mode].append(list_DTWm.min())
+            nearest[mode].append(int(np.argmin(list_DTWm)))
+    # Normalized dissimilarities (DTWm - E) / S of each mode, as in part1
+    normalized = {m: (np.array(minima[m]) - np.mean(minima[m])) / np.std(minima[m], ddof = 1) for m in DTW_MODES}
+    ks = ks_2samp(normalized['independent'], normalized['dependent'])
+    quantiles = (5, 25, 50, 75, 95)
+    return {'n_patients': len(patients), 'window': window, 'channel_scales': dict(zip(CHANNELS, np.asarray(scales, dtype = float).tolist())),
+            'duration_s': durations, 'speedup': durations['independent'] / max(durations['dependent'], 1e-12),
+            'same_nearest_original': float(np.mean(np.equal(nearest['independent'], nearest['dependent']))),
+            'DTWm_rank_correlation': float(np.corrcoef(np.argsort(np.argsort(minima['independent'])), np.argsort(np.argsort(minima['dependent'])))[0, 1]),
+            'dissim_norm_quantiles': {m: dict(zip([f'p{q}' for q in quantiles], np.percentile(normalized[m], quantiles).tolist())) for m in DTW_MODES},
+            'dissim_norm_mean_abs_difference': float(np.mean(np.abs(normalized['independent'] - normalized['dependent']))), # Patient by patient
+            'KS_statistic': float(ks.statistic), 'KS_pvalue': float(ks.pvalue)}
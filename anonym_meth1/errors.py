@@ -0,0 +1,34 @@
+###############################################################################
+# Errors of the analysis steps : raised by the library, reported by the      #
+#  scripts as '[<kind>] <message>' on stderr before exiting with status 1    #
+###############################################################################
+
+# Import libraries
+import sys, contextlib
+
+########################################################################################################################################################
+
+class AnalysisError(Exception):
+    """ Error of a step of the analysis (missing folder or file, unreadable values, settings of a resumed run, ...)
+    Arguments:
+    kind = kind of error printed between brackets (e.g., 'FileNotFoundError', 'ResumeError')
+    message = description of the error """
+
+    def __init__(self, kind, message):
+        super().__init__(kind, message) # Both arguments are kept : the error can be sent back from a worker process
+        self.kind = kind
+        self.message = message
+
+    def __str__(self):
+        return f'[{self.kind}] {self.message}'
+
+
+@contextlib.contextmanager
+def exit_on_error():
+    """ Write the AnalysisError raised in the block on stderr and exit with status 1 (used by the main function of the scripts) """
+
+    try:
+        yield
+    except AnalysisError as error:
+        sys.stderr.write(f"{error} \n")
+        exit(1)
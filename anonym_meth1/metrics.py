@@ -0,0 +1,157 @@
+###############################################################################
+# Opt-in run metrics (wall & CPU time per stage, files read, DTW calls,     #
+#  cache hits, peak memory, per-patient latencies) and cProfile output      #
+###############################################################################
+
+# Import libraries
+import sys, json, time, cProfile, contextlib
+import numpy as np
+try:
+    import resource
+except ImportError: # Windows : no peak memory nor CPU time of the child processes (null in the metrics file)
+    resource = None
+
+# Metrics of the current process (None : disabled, every call below is then a no-op)
+_current = None
+NO_STAGE = contextlib.nullcontext()
+
+########################################################################################################################################################
+
+class Metrics:
+    """ Wall and CPU time of each stage, counters and per-patient latencies of a run """
+
+    def __init__(self, script):
+        self.script = script
+        self.start_wall, self.start_cpu = time.perf_counter(), time.process_time()
+        self.stages = {}
+        self.counters = {}
+        self.latencies = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Add the wall and CPU time of the block to the stage name """
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0})
+            stage['wall_s'] += time.perf_counter() - wall
+            stage['cpu_s'] += time.process_time() - cpu
+            stage['calls'] += 1
+
+    def count(self, name, value = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, counters, latencies = ()):
+        """ Add the counters and latencies measured in a worker process """
+
+        for name, value in counters.items():
+            self.count(name, value)
+        self.latencies.extend(latencies)
+
+    def take(self):
+        """ Return and reset (counters, latencies), to send them from a worker process to the main one """
+
+        counters, latencies = self.counters, self.latencies
+        self.counters, self.latencies = {}, []
+        return counters, latencies
+
+    def summary(self):
+        """ Return the metrics of the run as a JSON-serializable dictionary """
+
+        usage = {'peak_rss_bytes': None, 'peak_rss_children_bytes': None, 'cpu_children_s': None}
+        if resource is not None:
+            scale = 1 if sys.platform == 'darwin' else 1024 # ru_maxrss : bytes on macOS, kilobytes on Linux
+            own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+            usage = {'peak_rss_bytes': own.ru_maxrss * scale, 'peak_rss_children_bytes': children.ru_maxrss * scale,
+                     'cpu_children_s': children.ru_utime + children.ru_stime}
+        latencies = np.array(self.latencies)
+        return {'script': self.script, 'wall_s': time.perf_counter() - self.start_wall, 'cpu_s': time.process_time() - self.start_cpu,
+                'stages': self.stages, 'counters': self.counters, **usage,
+                'patient_latency_s': {'count': len(latencies), **({f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 99)} if len(latencies) else {}),
+                                      'max': float(latencies.max()) if len(latencies) else None}}
+
+########################################################################################################################################################
+
+def enable(script):
+    """ Start collecting the metrics of this process """
+
+    global _current
+    _current = Metrics(script)
+    return _current
+
+
+def current():
+    """ Metrics of this process, None when disabled """
+
+    return _current
+
+
+def stage(name):
+    """ Context manager timing a stage of the run (nothing when disabled) """
+
+    return NO_STAGE if _current is None else _current.stage(name)
+
+
+def count(name, value = 1):
+    """ Add value to the counter name (nothing when disabled) """
+
+    if _current is not None:
+        _current.count(name, value)
+
+
+def latency(seconds):
+    """ Add the computing time of one patient (nothing when disabled) """
+
+    if _current is not None:
+        _current.latencies.append(seconds)
+
+
+def dtw_cells(len_a, len_b, window = None):
+    """ Number of cells of the dynamic programming matrices of DTW computations (approximate with a Sakoe-Chiba window)
+    Arguments:
+    len_a, len_b = lengths of the series (numbers or arrays of the same shape)
+    window = absolute window (None : full matrices) """
+
+    cells = np.multiply(len_a, len_b, dtype = np.int64)
+    if window is not None:
+        cells = np.minimum(cells, (2 * int(window) - 1) * np.maximum(len_a, len_b))
+    return int(np.sum(cells))
+
+
+def add_arguments(parser):
+    """ Add the --metrics and --profile options to the parser of a script """
+
+    parser.add_argument('--metrics', default = None, metavar = 'FILE', help = 'save the metrics of the run (wall and CPU time per stage, files and bytes read, DTW calls and cells, '
+                                                                                'cache hits, peak memory, per-patient latency percentiles) into the JSON file FILE')
+    parser.add_argument('--profile', default = None, metavar = 'FILE', help = 'save the cProfile statistics of the main process into FILE (read with python3 -m pstats FILE), '
+                                                                                'use --workers 1 to profile the DTW loops')
+
+
+@contextlib.contextmanager
+def instrumented(script, file_metrics = None, file_profile = None):
+    """ Collect the metrics of the block into file_metrics and / or profile it into file_profile (nothing when both are None)
+    Arguments:
+    script = name of the script (saved with the metrics)
+    file_metrics = JSON file of the metrics (None : no metrics)
+    file_profile = cProfile output file (None : no profiling) """
+
+    global _current
+    if file_metrics is not None:
+        enable(script)
+    profiler = cProfile.Profile() if file_profile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(file_profile)
+            print(f'PROFILE : cProfile statistics saved into {file_profile} \n')
+        if file_metrics is not None:
+            with open(file_metrics, 'w') as f:
+                json.dump(_current.summary(), f, indent = 2)
+            _current = None
+            print(f'METRICS : metrics of the run saved into {file_metrics} \n')
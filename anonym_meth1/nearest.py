@@ -0,0 +1,221 @@
+##############################################################################
+# Exact nearest original patient : minimum multivariate DTW over the whole   #
+#  original cohort, with cascading lower bounds and early-abandoned DTW     #
+##############################################################################
+
+# Import libraries
+import numpy as np
+from dtaidistance import dtw, dtw_ndim
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+from anonym_meth1 import metrics
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.dtw_engine import absolute_window, stacked_patient
+
+# Names of the pruning counters (number of candidates discarded at each stage of the cascade)
+PRUNING_STAGES = ('candidates', 'pruned_kim', 'pruned_keogh', 'abandoned_dtw', 'full_dtw')
+
+# Relative safety margin of the lower bounds computed from prefix sums (rounding must never make a bound larger than the true distance)
+LB_MARGIN = 1e-9
+
+########################################################################################################################################################
+
+class ReferenceIndex:
+    """ Per-channel summaries of the original cohort used by the lower bounds : first and last values,
+    and envelope (minimum and maximum) of every original series """
+
+    def __init__(self, store_pr):
+        self.store = store_pr
+        self.lengths = store_pr.lengths()
+        starts, stops = store_pr.offsets[:-1], store_pr.offsets[1:] - 1
+        self.first = np.array([np.asarray(store_pr.channels[c])[starts] for c in CHANNELS]) # Shape (4, n_pr)
+        self.last = np.array([np.asarray(store_pr.channels[c])[stops] for c in CHANNELS])
+        self.lower = np.array([np.minimum.reduceat(store_pr.channels[c], starts) for c in CHANNELS])
+        self.upper = np.array([np.maximum.reduceat(store_pr.channels[c], starts) for c in CHANNELS])
+
+    def __len__(self):
+        return len(self.store)
+
+########################################################################################################################################################
+
+def lb_kim_squared(pa_series, index):
+    """ Return the (4, n_pr) squared LB_Kim bounds : the first points and the last points of two series are always matched by DTW
+    Arguments:
+    pa_series = tuple of the 4 series of one anonymized patient
+    index = ReferenceIndex of the original cohort """
+
+    lb = np.empty((len(CHANNELS), len(index)))
+    for c, q in enumerate(pa_series):
+        lb[c] = (q[0] - index.first[c]) ** 2
+        both_single = (len(q) == 1) & (index.lengths == 1) # Same cell : counted once
+        lb[c] += np.where(both_single, 0.0, (q[-1] - index.last[c]) ** 2)
+    return lb
+
+
+def lb_keogh_squared(pa_series, index, lb_kim, candidates = None):
+    """ Return the (4, n) squared LB_Keogh bounds, tightened with LB_Kim : the first and last points contribute their exact
+    matched cost, every other point of the anonymized series contributes its squared distance to the envelope of the original series
+    Arguments:
+    pa_series = tuple of the 4 series of one anonymized patient
+    index = ReferenceIndex of the original cohort
+    lb_kim = (4, n) squared LB_Kim bounds of the candidates (see lb_kim_squared)
+    candidates = indices of the n original patients bounded (None : all of them) """
+
+    lb = lb_kim.copy()
+    for c, q in enumerate(pa_series):
+        inner = np.sort(q[1:-1]) # Points between the first and the last ones
+        m = len(inner)
+        if m == 0:
+            continue
+        s1 = np.concatenate(([0.0], np.cumsum(inner)))
+        s2 = np.concatenate(([0.0], np.cumsum(inner ** 2)))
+        lo, hi = (index.lower[c], index.upper[c]) if candidates is None else (index.lower[c, candidates], index.upper[c, candidates])
+        # Points below the envelope : sum of (lo - q)^2, points above : sum of (q - hi)^2 (prefix sums over the sorted points)
+        k_lo = np.searchsorted(inner, lo, side = 'left')
+        k_hi = np.searchsorted(inner, hi, side = 'right')
+        below = k_lo * lo ** 2 - 2 * lo * s1[k_lo] + s2[k_lo]
+        above = (s2[m] - s2[k_hi]) - 2 * hi * (s1[m] - s1[k_hi]) + (m - k_hi) * hi ** 2
+        scale = k_lo * lo ** 2 + s2[k_lo] + (s2[m] - s2[k_hi]) + (m - k_hi) * hi ** 2
+        lb[c] += np.maximum(below + above - LB_MARGIN * scale, 0.0)
+    return lb
+
+def lb_keogh_window_squared(pa_series, pr_series, lb_kim, window):
+    """ Return the 4 squared LB_Keogh bounds of one pair under a Sakoe-Chiba window : the envelope of the original series
+    is taken over the band of each point (half-width window - 1 + length difference, dtaidistance convention)
+    Arguments:
+    pa_series = tuple of the 4 series of the anonymized patient
+    pr_series = tuple of the 4 series of the original patient
+    lb_kim = squared LB_Kim bounds of the pair (4 values)
+    window = absolute Sakoe-Chiba window """
+
+    lb = np.array(lb_kim, dtype = np.float64)
+    for c, (q, r) in enumerate(zip(pa_series, pr_series)):
+        if len(q) < 3:
+            continue
+        size = 2 * (window - 1 + abs(len(q) - len(r))) + 1
+        upper, lower = maximum_filter1d(r, size, mode = 'nearest'), minimum_filter1d(r, size, mode = 'nearest')
+        position = np.minimum(np.arange(1, len(q) - 1), len(r) - 1) # Points of q beyond the end of r are compared with its last band
+        inner = q[1:-1]
+        lb[c] += np.sum(np.maximum(lower[position] - inner, 0.0) ** 2 + np.maximum(inner - upper[position], 0.0) ** 2)
+    return lb
+
+########################################################################################################################################################
+
+def abandoning_DTWm(pa_series, pr_series, best, lb_channels, window = None):
+    """ Return the four univariate DTW distances of a pair, or None as soon as their mean can no longer be lower than best.
+    Each channel is computed with a max_dist equal to what remains of the budget 4 * best once the channels already computed
+    and the lower bounds of the next ones are taken away.
+    Arguments:
+    pa_series = tuple of the 4 series of the anonymized patient
+    pr_series = tuple of the 4 series of the original patient
+    best = best-so-far DTWm (np.inf if none)
+    lb_channels = lower bounds of the 4 univariate distances of the pair
+    window = absolute Sakoe-Chiba window (None : no band) """
+
+    distances, partial = [], 0.0
+    for c in range(len(CHANNELS)):
+        if np.isfinite(best):
+            max_dist = len(CHANNELS) * best - partial - lb_channels[c + 1:].sum()
+            if max_dist <= 0:
+                return None
+            d = dtw.distance(pa_series[c], pr_series[c], window = window, max_dist = max_dist, use_c = True)
+        else:
+            d = dtw.distance(pa_series[c], pr_series[c], window = window, use_c = True)
+        if metrics.current() is not None:
+            metrics.count('dtw_calls')
+            metrics.count('dtw_cells', metrics.dtw_cells(len(pa_series[c]), len(pr_series[c]), window)) # At most (abandoned DTW stop earlier)
+        if not np.isfinite(d): # Abandoned by dtaidistance : the distance is larger than max_dist
+            return None
+        distances.append(d)
+        partial += d
+    return distances
+
+
+def abandoning_dependent(pa_stacked, pr_stacked, best, window = None):
+    """ Return [dependent DTW distance] of a pair, or None when it exceeds best (the DP is abandoned by dtaidistance)
+    Arguments:
+    pa_stacked, pr_stacked = (length, 4) arrays of the anonymized and original patients (see stacked_patient)
+    best = best-so-far dependent distance (np.inf if none)
+    window = absolute Sakoe-Chiba window (None : no band) """
+
+    d = dtw_ndim.distance(pa_stacked, pr_stacked, window = window, max_dist = best if np.isfinite(best) else None, use_c = True)
+    if metrics.current() is not None:
+        metrics.count('dtw_calls')
+        metrics.count('dtw_cells', metrics.dtw_cells(len(pa_stacked), len(pr_stacked), window))
+    return [d] if np.isfinite(d) else None
+
+
+def nearest_original(pa_series, index, stats = None, window = None, mode = 'independent', scales = None):
+    """ Return (DTWm, index of the original patient, its 4 univariate distances or [dependent distance]) for the original patient closest to one
+    anonymized patient, over the whole original cohort. The DTW of the candidate with the lowest LB_Kim gives a first best-so-far distance,
+    LB_Kim then discards candidates before their LB_Keogh is computed, and the others are visited by increasing LB_Keogh and discarded
+    by LB_Keogh (global envelope, then band envelope when a window is used), then by early-abandoned DTW.
+    Arguments:
+    pa_series = tuple of the 4 series of the anonymized patient
+    index = ReferenceIndex of the original cohort
+    stats = dictionary of pruning counters (PRUNING_STAGES) updated in place
+    window = Sakoe-Chiba window, in samples or as a fraction of the anonymized series length
+    mode = 'independent' (mean of the four univariate DTW) or 'dependent' (DTW of the 4-dimensional series, see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+
+    if stats is None:
+        stats = dict.fromkeys(PRUNING_STAGES, 0)
+    pa_series = tuple(np.ascontiguousarray(s, dtype = np.float64) for s in pa_series)
+    window = absolute_window(window, len(pa_series[0]))
+
+    dependent = mode == 'dependent'
+    if dependent:
+        # The squared costs of the channels add up along the single warping path : the squared bounds of the channels add up too
+        weights = 1.0 / np.asarray(scales if scales is not None else np.ones(len(CHANNELS)), dtype = np.float64) ** 2
+        pa_stacked = stacked_patient(pa_series, scales)
+    best, best_pr, best_distances = np.inf, -1, None
+    if len(index) == 0:
+        return best, best_pr, best_distances
+
+    def visit(pr, lb_channels):
+        """ Band LB_Keogh (with a window), then DTW of one candidate abandoned beyond the best-so-far distance """
+        nonlocal best, best_pr, best_distances
+        pr_series = index.store.patient(pr)
+        if window is not None and np.isfinite(best):
+            lb_window = lb_keogh_window_squared(pa_series, pr_series, kim[:, pr], window)
+            lb_channels = None if dependent else np.sqrt(lb_window)
+            if (np.sqrt(weights @ lb_window) if dependent else lb_channels.mean()) >= best:
+                stats['pruned_keogh'] += 1
+                return
+        if dependent:
+            distances = abandoning_dependent(pa_stacked, stacked_patient(pr_series, scales), best, window)
+        else:
+            distances = abandoning_DTWm(pa_series, pr_series, best, lb_channels, window)
+        if distances is None:
+            stats['abandoned_dtw'] += 1
+            return
+        stats['full_dtw'] += 1
+        DTWm = np.mean(distances) # Same operation as the mean of the four parameter distances in DTWm_block (the distance itself when dependent)
+        if DTWm < best:
+            best, best_pr, best_distances = DTWm, int(pr), distances
+
+    # Stage 1 : LB_Kim (first and last points) of every candidate, against the distance of the most promising one
+    kim = lb_kim_squared(pa_series, index)
+    kim_m = np.sqrt(weights @ kim) if dependent else np.sqrt(kim).mean(axis = 0) # Bounds of the mean of the four distances when independent
+    stats['candidates'] += len(index)
+    first = int(np.argmin(kim_m))
+    visit(first, np.sqrt(kim[:, first]))
+    survivors = np.flatnonzero(kim_m < best)
+    survivors = survivors[survivors != first]
+    stats['pruned_kim'] += len(index) - 1 - len(survivors)
+
+    # Stage 2 : LB_Keogh (envelopes) of the remaining candidates only, visited by increasing bound
+    keogh = lb_keogh_squared(pa_series, index, kim[:, survivors], survivors)
+    if dependent:
+        keogh_channels, keogh_m = None, np.sqrt(weights @ keogh)
+    else:
+        keogh_channels = np.sqrt(keogh)
+        keogh_m = keogh_channels.mean(axis = 0)
+    order = np.argsort(keogh_m, kind = 'stable') # Most promising candidates first
+    for rank, k in enumerate(order):
+        if keogh_m[k] >= best: # All the remaining candidates have larger bounds
+            stats['pruned_keogh'] += len(order) - rank
+            break
+        visit(int(survivors[k]), None if dependent else keogh_channels[:, k])
+
+    return best, best_pr, best_distances
@@ -0,0 +1,586 @@
+###############################################################################
+# Part1 of the analysis : minimum multivariate DTW distance between each     #
+#  anonymized patient and real patients, and normalized dissimilarities      #
+###############################################################################
+
+# Import libraries
+import os, glob, time
+import random, statistics
+import multiprocessing, functools
+import json, pandas as pd
+import numpy as np
+import dtaidistance
+from anonym_meth1 import metrics
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.cohort_store import load_cohort, list_series_files
+from anonym_meth1.dtw_engine import distance_block, DTWm_block, absolute_window, compare_window, compare_modes, channel_scales, stacked_patient
+from anonym_meth1.nearest import ReferenceIndex, nearest_original, abandoning_DTWm, abandoning_dependent, PRUNING_STAGES
+from anonym_meth1.replicates import load_DTWm_matrix, replicate_minima, normalize_minima, replicate_spread
+from anonym_meth1.screening import PAAIndex, screened_nearest, screening_recall, PAA_SEGMENTS
+from anonym_meth1.records import RecordWriter, records_file, patient_record, read_DTWm_minimum
+from anonym_meth1.distance_cache import DistanceCache, MAX_ENTRIES
+from anonym_meth1.results_file import results_file, update_results
+from anonym_meth1.prefetch import Prefetcher, LoadedPatients, copy_patient
+
+########################################################################################################################################################
+
+def get_patient_rng(seed, pa_id):
+    """ Return the random generator of one anonymized patient. It only depends on the seed of the run and on the patient ID, 
+    so the 10 real patients drawn for a patient are the same whatever the number of workers and the processing order.
+    Arguments:
+    seed = seed of the run (--seed)
+    pa_id = ID of the anonymized patient (number of its series file) """
+    
+    if seed < 0 :
+        raise AnalysisError('ValueError', f'The seed must be a non-negative integer, not {seed}')
+    state = np.random.SeedSequence([seed, pa_id]).generate_state(2) # Independent stream for each (seed, patient) pair
+    return random.Random(int(state[0]) << 32 | int(state[1]))
+
+########################################################################################################################################################
+
+def get_random_pr_series(store_pr, rng = random):
+    """ Return the indices of 10 random files from the real "series" files
+    Arguments:
+    store_pr = cohort store of the original folder (real patients, multivariate)
+    rng = random generator (see get_patient_rng) """
+    
+    # Pick 10 random files from the sorted list
+    # Sampling the indices draws the same files as rng.sample(list_pr_series, 10)
+    random_pr_series = rng.sample(range(len(store_pr)), 10) 
+    
+    return random_pr_series
+
+########################################################################################################################################################
+
+def get_list_pa_series(path_pa):
+    """Return the list of 'series' files for anonymized patient 
+    Argument:
+    path_pa = path of anonymized folder """
+    
+    try:
+        list_pa_multi = glob.glob(os.path.join(path_pa, "*.txt")) # Check files into the anonymized folder 
+        list_pa_series = []
+     
+        for files_pa in list_pa_multi: 
+            if files_pa.endswith("_series.txt"):
+                list_pa_series.append(files_pa)
+            
+    except FileNotFoundError:
+        raise AnalysisError('FileNotFoundError', f'Impossible to open the folder : {path_pa}')
+        
+    return list_pa_series
+
+#######################################################################################################################################################
+
+def DTWm_minimum_patient(store_pa, store_pr, pa, seed, parallel = True, window = None, max_dist = False, cache = None, mode = 'independent', scales = None):
+    """ Measure univariate DTW distances between one anonymized patient and 10 real patients (randomly chosen), 
+    then multivariate DTW distances (mean of FC, PAS, PAM & PAD), and return (minimum DTWm, indices of the 10 real patients, 
+    (4, 10) univariate distances). With mode = 'dependent', one DTW of the 4-dimensional series per pair gives the DTWm ((1, 10) distances)
+    Arguments:
+    store_pa = cohort store of the anonymized folder
+    store_pr = cohort store of the original folder
+    pa = index of the anonymized patient in store_pa
+    seed = seed of the run
+    parallel = use the OpenMP threads of dtaidistance
+    window = Sakoe-Chiba window, in samples or as a fraction of the anonymized series length (None : no window)
+    max_dist = abandon the pairs whose DTWm exceeds the running minimum (the minimum itself is unchanged)
+    cache = DistanceCache of univariate distances (None : no cache, not used with max_dist)
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+    
+    # Anonymized time series (np.ndarray views of the store)
+    pa_series = store_pa.patient(pa) # FC, PAS, PAM & PAD columns
+    
+    rng = get_patient_rng(seed, int(store_pa.ids[pa])) # Random stream of this anonymized patient
+    random_pr_10_series = get_random_pr_series(store_pr, rng) # Get 10 random pr series for each pa series
+    pr_10_series = [store_pr.patient(i) for i in random_pr_10_series] # Real time series (FC, PAS, PAM & PAD columns)
+    
+    if max_dist :
+        # Pair by pair, each DTW stopping as soon as the DTWm can no longer be lower than the running minimum (abandoned pairs : inf)
+        running_minimum, list_DTWm, lists_dist_param = np.inf, [], []
+        pa_series = tuple(np.ascontiguousarray(s) for s in pa_series)
+        n_distances = 1 if mode == 'dependent' else 4
+        for pr_series in pr_10_series :
+            if mode == 'dependent' :
+                distances = abandoning_dependent(stacked_patient(pa_series, scales), stacked_patient(pr_series, scales), running_minimum, absolute_window(window, len(pa_series[0])))
+            else :
+                distances = abandoning_DTWm(pa_series, pr_series, running_minimum, np.zeros(4), absolute_window(window, len(pa_series[0])))
+            list_DTWm.append(np.inf if distances is None else np.mean(distances))
+            lists_dist_param.append([np.nan] * n_distances if distances is None else distances)
+            running_minimum = min(running_minimum, list_DTWm[-1])
+        return min(list_DTWm), random_pr_10_series, np.array(lists_dist_param).T
+    
+    # Measure univariate DTW distances between pa and the 10 pr : one native call per parameter, shape (4, 1, 10) (dependent : one call, shape (1, 1, 10))
+    lists_dist_param = distance_block([pa_series], pr_10_series, parallel = parallel, window = window, cache = cache, mode = mode, scales = scales) 
+    
+    # Measure multivariate DTW (mean of the four parameter distances of each pair)
+    list_DTWm = DTWm_block(lists_dist_param)[0] 
+    
+    # Return the minimum DTWm on the 10 real patients 
+    return list_DTWm.min(), random_pr_10_series, lists_dist_param[:, 0, :]
+
+#######################################################################################################################################################
+
+def DTWm_nearest_patient(store_pa, index, pa, window = None, mode = 'independent', scales = None):
+    """ Return (minimum DTWm, index of the nearest real patient, its 4 univariate distances or [dependent distance]) between one anonymized patient and 
+    all the real patients (exact nearest original), and the pruning counters of the search (see anonym_meth1.nearest)
+    Arguments:
+    store_pa = cohort store of the anonymized folder
+    index = ReferenceIndex of the original folder
+    pa = index of the anonymized patient in store_pa
+    window = Sakoe-Chiba window (None : no window)
+    mode, scales = multivariate DTW (see DTW_MODES and channel_scales) """
+    
+    stats = dict.fromkeys(PRUNING_STAGES, 0)
+    DTWm, pr, distances = nearest_original(store_pa.patient(pa), index, stats, window, mode, scales) 
+    return (DTWm, [pr], np.array(distances)[:, None]), stats
+
+
+def DTWm_patient(state, pa, parallel = True):
+    """ Return (record, pruning counters or None) of one anonymized patient for the chosen reference (see patient_record)
+    Arguments:
+    state = dictionary of the stores, DTW settings and reference index (None when comparing with 10 random real patients)
+    pa = index of the anonymized patient
+    parallel = use the OpenMP threads of dtaidistance """
+    
+    stats = None
+    if state['reference'] == 'screened' :
+        DTWm, pr, distances = screened_nearest(state['store_pa'].patient(pa), state['index'], state['top_k'], state['window'], parallel, state['cache'], state['dtw_mode'], state['scales'])
+        result = (DTWm, [pr], np.array(distances)[:, None])
+    elif state['index'] is None :
+        result = DTWm_minimum_patient(state['store_pa'], state['store_pr'], pa, state['seed'], parallel, state['window'], state['max_dist'], state['cache'], state['dtw_mode'], state['scales'])
+    else :
+        result, stats = DTWm_nearest_patient(state['store_pa'], state['index'], pa, state['window'], state['dtw_mode'], state['scales'])
+    return patient_record(state['store_pa'], state['store_pr'], pa, *result), stats
+
+
+def get_state(store_pa, store_pr, settings, file_cache = None):
+    """ Return the state used by DTWm_patient : cohort stores, settings of the run, reference index 
+    (ReferenceIndex with --reference all, PAAIndex with --reference screened), factors of the channels of the dependent DTW and distance cache
+    Arguments:
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    settings = dictionary of the settings of the run (seed, reference, window, max_dist, dtw_mode, channel_scale, and top_k with reference = 'screened')
+    file_cache = SQLite file of the distance cache (None : no cache) """
+    
+    index = {'all': ReferenceIndex, 'screened': PAAIndex}.get(settings['reference'])
+    cache = DistanceCache(file_cache) if file_cache else None
+    scales = channel_scales(store_pr, settings['channel_scale']) if settings['dtw_mode'] == 'dependent' else None
+    return dict(settings, store_pa = store_pa, store_pr = store_pr, index = index(store_pr) if index else None, scales = scales, cache = cache)
+
+
+def load_patient(state, pa):
+    """ Return ({pa: series}, {pr: series}) : copies in memory of the series of an anonymized patient and, with the random reference,
+    of the 10 real patients it is compared with (run by the I/O threads of a Prefetcher, ahead of the DTW of this patient)
+    Arguments:
+    state = state of the run (see get_state)
+    pa = index of the anonymized patient """
+    
+    store_pa, store_pr = state['store_pa'], state['store_pr']
+    originals = []
+    if state['reference'] == 'random' :
+        originals = get_random_pr_series(store_pr, get_patient_rng(state['seed'], int(store_pa.ids[pa]))) # Same draw as DTWm_minimum_patient
+    return {pa: copy_patient(store_pa, pa)}, {pr: copy_patient(store_pr, pr) for pr in originals}
+
+
+def patient_states(state, patients, io_threads = 0, depth = None):
+    """ Return (iterator of (pa, state used for this patient), Prefetcher or None). With io_threads, the series of the next patients are read
+    by a pool of I/O threads, at most depth patients ahead, while the DTW of the current one runs (see anonym_meth1.prefetch)
+    Arguments:
+    state = state of the run (see get_state)
+    patients = indices of the anonymized patients, in the order of the computations
+    io_threads = number of I/O threads (0 : the series are read by the DTW itself)
+    depth = maximal number of patients read ahead (default : 2 per I/O thread) """
+    
+    if io_threads <= 0 :
+        return ((pa, state) for pa in patients), None
+    prefetcher = Prefetcher(functools.partial(load_patient, state), patients, io_threads, depth)
+    states = ((pa, dict(state, store_pa = LoadedPatients(state['store_pa'], loaded_pa), store_pr = LoadedPatients(state['store_pr'], loaded_pr)))
+              for pa, (loaded_pa, loaded_pr) in prefetcher)
+    return states, prefetcher
+
+#######################################################################################################################################################
+
+# Cohort stores, settings, reference index and distance cache of a worker process (filled by init_worker, one copy per process)
+worker_state = {}
+
+def init_worker(path_pr, list_pr_series, path_pa, list_pa_series, settings, file_cache = None, collect_metrics = False, io_threads = 0, prefetch_depth = None):
+    """ Open the cohort stores (memory-mapped, nothing is copied from the main process) and the distance cache in a worker process,
+    and collect its metrics when collect_metrics (sent back with each chunk of patients) """
+    if collect_metrics :
+        metrics.enable('worker')
+    store_pr, store_pa = load_cohort(path_pr, list_pr_series), load_cohort(path_pa, list_pa_series)
+    worker_state.update(get_state(store_pa, store_pr, settings, file_cache), prefetch = (io_threads, prefetch_depth))
+
+
+def DTWm_minimum_worker(patients):
+    """ Run DTWm_patient on a chunk of anonymized patients in a worker process (one process per core : no OpenMP threads), their series
+    being read ahead by I/O threads of the worker with prefetch (see patient_states). Return the (record, pruning counters) of the patients,
+    the cache hits and misses of the chunk, the counters of the read-ahead (None without it) and the metrics of the worker since its previous
+    chunk (None when disabled) """
+    cache = worker_state['cache']
+    before = (cache.hits, cache.misses) if cache else (0, 0)
+    results = []
+    states, prefetcher = patient_states(worker_state, patients, *worker_state['prefetch'])
+    for pa, state in states :
+        start = time.perf_counter()
+        results.append(DTWm_patient(state, pa, parallel = False))
+        metrics.latency(time.perf_counter() - start)
+    worker_metrics = metrics.current().take() if metrics.current() is not None else None
+    counts = (cache.hits - before[0], cache.misses - before[1]) if cache else (0, 0)
+    return results, counts, prefetcher.summary() if prefetcher else None, worker_metrics
+
+#######################################################################################################################################################
+
+def print_pruning(list_stats):
+    """ Print how many candidates each stage of the exact search discarded 
+    Argument:
+    list_stats = pruning counters of each anonymized patient """
+    
+    total = {k: sum(stats[k] for stats in list_stats) for k in PRUNING_STAGES}
+    n = max(total['candidates'], 1)
+    print(f"PRUNING : {total['candidates']} candidate pairs (anonymized x original patients)")
+    print(f"  - discarded by LB_Kim : {total['pruned_kim']} ({100 * total['pruned_kim'] / n:.1f}%)")
+    print(f"  - discarded by LB_Keogh : {total['pruned_keogh']} ({100 * total['pruned_keogh'] / n:.1f}%)")
+    print(f"  - early-abandoned DTW : {total['abandoned_dtw']} ({100 * total['abandoned_dtw'] / n:.1f}%)")
+    print(f"  - full DTW : {total['full_dtw']} ({100 * total['full_dtw'] / n:.1f}%) \n")
+
+
+def print_prefetch(summaries, elapsed, processes):
+    """ Print how long the DTW waited for the series read ahead by the I/O threads
+    Arguments:
+    summaries = counters of the Prefetcher of each process and chunk (see Prefetcher.summary)
+    elapsed = duration of the DTW loop (wall time)
+    processes = number of processes running the DTW """
+    
+    items, load_s, wait_s = (sum(s[k] for s in summaries) for k in ('items', 'load_s', 'wait_s'))
+    print(f"PREFETCH : {items} anonymized patients read ahead by {summaries[0]['threads']} I/O threads per process (at most {summaries[0]['depth']} ahead), "
+          f"{load_s:.2f} s of reads, the DTW waited {wait_s:.2f} s for I/O ({100 * wait_s / max(elapsed * processes, 1e-9):.1f}% of its time) \n")
+
+
+def close_cache(cache, hits, misses):
+    """ Evict the least recently used distances beyond the size of the cache, close it and print its counters
+    Arguments:
+    cache = DistanceCache
+    hits, misses = number of distances found in and missing from the cache during the run (all processes) """
+    
+    evicted = cache.evict()
+    print(f'DTW CACHE : {hits} hits, {misses} misses ({100 * hits / max(hits + misses, 1):.1f}% of the distances read from {cache.file}), '
+          f'{len(cache)} distances cached, {evicted} evicted \n')
+    cache.close()
+
+#######################################################################################################################################################
+
+def DTWu_m_minimum(path_pr, path_pa, file_records, seed, workers = 1, reference = 'random', window = None, max_dist = False, top_k = 20, resume = False, 
+                   file_cache = None, cache_size = MAX_ENTRIES, io_threads = 0, prefetch_depth = None, dtw_mode = 'independent', channel_scale = 'none', parallel = True):
+    """ Read series files (through the cohort store), measure univariate DTW distances between each anonymized patients and 10 real patients 
+    (randomly chosen) or all of them (reference = 'all'), then measure multivariate DTW disantces (mean of FC, PAS, PAM & PAD), and append 
+    the record of each anonymized patient (see patient_record) to the records file as soon as it is computed
+    Arguments:
+    path_pr = path of the original folder
+    path_pa = path of anonymized folder 
+    file_records = records file of the run (see records_file)
+    seed = seed of the run (each anonymized patient gets its own random stream, see get_patient_rng)
+    workers = number of processes sharing the anonymized patients 
+    reference = 'random' (10 random real patients), 'all' (exact nearest original, with lower-bound pruning) 
+                or 'screened' (approximate nearest original, top_k candidates of a coarse DTW refined)
+    window = Sakoe-Chiba window, in samples or as a fraction of the anonymized series length (None : no window)
+    max_dist = abandon DTW computations exceeding the running minimum DTWm of each anonymized patient
+    top_k = number of candidates refined at full resolution with reference = 'screened'
+    resume = keep the records of a previous run with the same settings and only compute the missing patients
+    file_cache = SQLite file of the univariate DTW distances shared across runs (None : no cache)
+    cache_size = maximal number of cached distances
+    io_threads = number of I/O threads reading the series of the next anonymized patients during the DTW (0 : no read-ahead),
+                 and parsing the series files when a cohort store is (re)built
+    prefetch_depth = maximal number of anonymized patients read ahead (default : 2 per I/O thread)
+    dtw_mode = 'independent' (DTWm = mean of the four univariate DTW) or 'dependent' (one DTW of the 4-dimensional series, see DTW_MODES)
+    channel_scale = with dtw_mode = 'dependent', scaling of the channels (see channel_scales)
+    parallel = with workers = 1, use the OpenMP threads of dtaidistance (False when several runs share the cores, e.g. the sweep)
+    Return the records computed by this run, in the order of the anonymized patients (with resume, the kept ones are only in the records file)
+    """
+    
+    list_pa_series = list_series_files(path_pa) # Get anonymized patient series, sorted by ascending order
+    list_pr_series = list_series_files(path_pr)
+    
+    # Load both cohorts from their binary stores (CSV files are only parsed when the store is missing or out of date)
+    with metrics.stage('load_cohort'):
+        store_pa = load_cohort(path_pa, list_pa_series, io_threads = io_threads)
+        store_pr = load_cohort(path_pr, list_pr_series, io_threads = io_threads)
+    
+    # Settings written at the top of the records file (a run can only be resumed with the same settings and cohorts)
+    settings = {'seed': seed, 'reference': reference, 'window': window, 'max_dist': max_dist, 'dtw_mode': dtw_mode, 'channel_scale': channel_scale}
+    if reference == 'screened' : # Only used by the screening : changing it in other modes does not prevent a resume
+        settings['top_k'] = top_k
+    cohorts = {'pa': store_pa.fingerprint(), 'pr': store_pr.fingerprint()}
+    try :
+        writer = RecordWriter(file_records, dict(settings, cohorts = cohorts), resume)
+    except (IOError, ValueError) as e :
+        raise AnalysisError('ResumeError', str(e))
+    
+    # For the 1000 anonymized patients (except the ones already written with --resume) :
+    pending = [pa for pa in range(len(store_pa)) if pa not in writer.done]
+    if resume :
+        print(f'RESUME : {len(writer.done)} anonymized patients already done, {len(pending)} left. \n')
+    records, list_stats, hits, misses, prefetched = [], [], 0, 0, []
+    with writer :
+        if workers > 1 :
+            # Spread chunks of anonymized patients across a process pool (results come back in the order of the patients, and are written as they come)
+            initargs = (path_pr, list_pr_series, path_pa, list_pa_series, settings, file_cache, metrics.current() is not None, io_threads, prefetch_depth)
+            chunksize = max(1, len(pending) // (workers * 8))
+            chunks = [pending[i:i + chunksize] for i in range(0, len(pending), chunksize)]
+            start_loop = time.perf_counter()
+            with multiprocessing.Pool(workers, initializer = init_worker, initargs = initargs) as pool, metrics.stage('dtw_workers'):
+                for results, counts, prefetch, worker_metrics in pool.imap(DTWm_minimum_worker, chunks):
+                    with metrics.stage('write_records'):
+                        for record, stats in results :
+                            writer.write(record)
+                            records.append(record)
+                            list_stats.append(stats)
+                    hits, misses = hits + counts[0], misses + counts[1]
+                    if prefetch is not None :
+                        prefetched.append(prefetch)
+                    if worker_metrics is not None :
+                        metrics.current().merge(*worker_metrics)
+        else :
+            with metrics.stage('index'):
+                state = get_state(store_pa, store_pr, settings, file_cache)
+            states, prefetcher = patient_states(state, pending, io_threads, prefetch_depth)
+            start_loop = time.perf_counter()
+            for pa, patient_state in states :
+                with metrics.stage('dtw'):
+                    start = time.perf_counter()
+                    record, stats = DTWm_patient(patient_state, pa, parallel)
+                    metrics.latency(time.perf_counter() - start)
+                with metrics.stage('write_records'):
+                    writer.write(record)
+                records.append(record)
+                list_stats.append(stats)
+            if prefetcher is not None :
+                prefetched.append(prefetcher.summary())
+            if state['cache'] :
+                hits, misses = state['cache'].hits, state['cache'].misses
+                state['cache'].close()
+    
+    if prefetched :
+        print_prefetch(prefetched, time.perf_counter() - start_loop, min(workers, max(len(pending), 1)))
+    if reference == 'all' :
+        print_pruning(list_stats)
+    if reference == 'screened' :
+        n_refined = len(pending) * min(top_k, len(store_pr))
+        print(f'SCREENING : {n_refined} of {len(pending) * len(store_pr)} candidate pairs refined at full resolution ({100 * n_refined / max(len(pending) * len(store_pr), 1):.1f}%) \n')
+    if file_cache :
+        close_cache(DistanceCache(file_cache, cache_size), hits, misses)
+        metrics.count('cache_hits', hits)
+        metrics.count('cache_misses', misses)
+    metrics.count('patients', len(pending))
+    
+    return records
+
+########################################################################################################################################################  
+
+def save_distribution(path_analysis_anonym, filename_csv, dissim_norm, columnar = False):
+    """ Save the normalized dissimilarities into a csv file, or into the results file of the analysis folder
+    Arguments:
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder
+    filename_csv = output filename of normalized dissimilarities (kept in the results file for the csv export)
+    dissim_norm = 1D array of normalized dissimilarities
+    columnar = save them into the results file (see anonym_meth1.results_file) """
+    
+    if columnar :
+        update_results(results_file(path_analysis_anonym), {'dissim_norm': dissim_norm}, {'distribution_csv': filename_csv})
+    else :
+        # Csv file (txt works too) with header 'dissim_norm' and delimiter ','
+        np.savetxt(f'{path_analysis_anonym}{filename_csv}', dissim_norm, delimiter = ',', header = "dissim_norm", fmt='%f', comments = '')
+
+
+def normalized_dissimilarities(DTWm_minimum):
+    """ Return the normalized dissimilarities (DTWm - E) / S of the minimum DTWm of the anonymized patients, E and S being their mean
+    and standard deviation
+    Argument:
+    DTWm_minimum = list or 1D array of minimum DTWm (one per anonymized patient) """
+    
+    try : 
+        mean_E = statistics.mean(DTWm_minimum) # Calculate the mean of all minimum DTWm
+        standev_S = statistics.stdev(DTWm_minimum) # Calculate the standard deviation of all minimum DTWm
+        DTWm_minimum_array = np.array(DTWm_minimum) #  Convert the list of float into a numpy array
+        dissim_norm = (DTWm_minimum_array - mean_E)/standev_S # Calculate normalized dissimilarities
+        
+    except ValueError :
+        raise AnalysisError('StatisticError', 'There is a problem in at least one statistics operation.')
+    
+    return dissim_norm
+
+
+def normalize_DTWm_min(path_analysis_anonym, filename_csv, columnar = False):
+    
+    """ Calculate the mean E and the standard error S from the minimum DTWm of the records file (see records_file) 
+    and return each normalized dissimilarities (1000), also saved into a csv file
+    Arguments : 
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder  
+    filename_csv = output filename of normalized dissimilarities
+    columnar = save them into the results file of the analysis folder instead
+    """
+
+    try :
+        # Read the minimum DTWm of the records file, in the order of the anonymized patients
+        DTWm_minimum = read_DTWm_minimum(records_file(path_analysis_anonym, filename_csv))
+            
+    except IsADirectoryError:
+        raise AnalysisError('IsADirectoryError', f"Is a directory: '{path_analysis_anonym}'")
+        
+    except FileNotFoundError :
+        raise AnalysisError('FileNotFoundError', f"No such file or directory: '{records_file(path_analysis_anonym, filename_csv)}'")
+        
+    dissim_norm = normalized_dissimilarities(DTWm_minimum)
+    
+    try :    
+        # Save normalized dissimilarities
+        save_distribution(path_analysis_anonym, filename_csv, dissim_norm, columnar)
+ 
+    except IOError :
+        raise AnalysisError('IOError', f'No such file or directory : {path_analysis_anonym}')
+    
+    return dissim_norm
+
+########################################################################################################################################################  
+
+def DTWm_replicates(path_pr, path_pa, path_analysis_anonym, filename_csv, seed, n_replicates, window = None, file_cache = None, cache_size = MAX_ENTRIES, columnar = False,
+                    dtw_mode = 'independent', channel_scale = 'none', parallel = True):
+    """ Monte Carlo mode : compute (or load from the cache) the full matrix of multivariate DTW distances between anonymized 
+    and real patients once, then draw n_replicates sets of 10 random real patients for each anonymized patient, and write the 
+    n_replicates distributions of normalized dissimilarities and their spread into csv files
+    Arguments:
+    path_pr = path of the original folder
+    path_pa = path of anonymized folder 
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder (also holds the cached DTWm matrix)
+    filename_csv = output filename of normalized dissimilarities (first replicate)
+    seed = seed of the replicates
+    n_replicates = number of replicates (K)
+    window = Sakoe-Chiba window (None : no window)
+    file_cache = SQLite file of the univariate DTW distances shared across runs (None : no cache)
+    cache_size = maximal number of cached distances
+    columnar = save the first replicate into the results file of the analysis folder instead of filename_csv
+    dtw_mode, channel_scale = multivariate DTW (see DTW_MODES and channel_scales)
+    parallel = use the OpenMP threads of dtaidistance
+    Return the (n_replicates, number of anonymized patients) array of normalized dissimilarities """
+    
+    list_pa_series = list_series_files(path_pa) # Get anonymized patient series, sorted by ascending order
+    store_pa, store_pr = load_cohort(path_pa, list_pa_series), load_cohort(path_pr, list_series_files(path_pr))
+    
+    cache = DistanceCache(file_cache, cache_size) if file_cache else None
+    scales = channel_scales(store_pr, channel_scale) if dtw_mode == 'dependent' else None
+    matrix = load_DTWm_matrix(path_analysis_anonym, store_pa, store_pr, parallel = parallel, window = window, cache = cache, mode = dtw_mode, scales = scales) # Shape (n_pa, n_pr)
+    if cache :
+        close_cache(cache, cache.hits, cache.misses)
+    minima = replicate_minima(matrix, n_replicates, np.random.default_rng(seed)) # Shape (K, n_pa)
+    dissim_norm = normalize_minima(minima)
+    spread = pd.DataFrame(replicate_spread(minima, dissim_norm))
+    
+    try :
+        stem = os.path.splitext(filename_csv)[0]
+        # One column of normalized dissimilarities per replicate
+        df_replicates = pd.DataFrame(dissim_norm.T, columns = [f'dissim_norm_{k + 1}' for k in range(n_replicates)])
+        df_replicates.to_csv(f'{path_analysis_anonym}{stem}_replicates.csv', sep = ',', index = False, float_format = '%f')
+        # One row of summaries (E, S, quantiles of the normalized dissimilarities) per replicate
+        spread.to_csv(f'{path_analysis_anonym}{stem}_replicates_spread.csv', sep = ',', index = False)
+        # The first replicate is also saved as the usual distribution file (used by part3 and the boxplot)
+        save_distribution(path_analysis_anonym, filename_csv, dissim_norm[0], columnar)
+        
+    except IOError :
+        raise AnalysisError('IOError', f'No such file or directory : {path_analysis_anonym}')
+    
+    print(f'SPREAD : standard deviation over the {n_replicates} replicates of E = {spread["mean_E"].std():.6f}, S = {spread["standev_S"].std():.6f}, '
+          f'median of the normalized dissimilarities = {spread["median"].std():.6f} \n')
+    
+    return dissim_norm
+
+########################################################################################################################################################  
+
+def write_metadata(path_analysis_anonym, filename_csv, args, seed, window_comparison = None, recall = None, mode_comparison = None):
+    """ Save the settings of the run next to the output file, as <filename>_metadata.json (with --columnar, into the results file)
+    Arguments:
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder
+    filename_csv = output filename of normalized dissimilarities
+    args = parsed arguments of the command line
+    seed = seed of the run
+    window_comparison = result of compare_window (None if not measured)
+    recall = result of screening_recall (None if not measured)
+    mode_comparison = result of compare_modes (None if not measured) """
+    
+    metadata = {'script': 'analysis_anonym_meth1_part1.py', 'path_pr': args.path_pr, 'path_pa': args.path_pa, 'seed': seed,
+                'reference': args.reference, 'replicates': args.replicates, 'workers': args.workers,
+                'dtw': {'implementation': f'dtaidistance {dtaidistance.__version__} (C)',
+                        'mode': args.dtw_mode, 'DTWm': 'DTW of the 4-dimensional series' if args.dtw_mode == 'dependent' else 'mean of the 4 univariate DTW',
+                        'channel_scale': args.channel_scale if args.dtw_mode == 'dependent' else None,
+                        'window': args.window, 
+                        'window_unit': None if args.window is None else ('samples' if args.window >= 1 else 'fraction of the anonymized series length'),
+                        'max_dist': 'running minimum DTWm of the anonymized patient' if (args.max_dist or args.reference == 'all') else None},
+                'window_comparison': window_comparison, 'mode_comparison': mode_comparison,
+                'screening': {'top_k': args.top_k, 'paa_segments': PAA_SEGMENTS, 'recall': recall} if args.reference == 'screened' else None}
+    try :
+        if args.columnar :
+            update_results(results_file(path_analysis_anonym), {}, {'part1': metadata, 'seed': seed, 'dtw': metadata['dtw']})
+            return
+        with open(f'{path_analysis_anonym}{os.path.splitext(filename_csv)[0]}_metadata.json', 'w') as f:
+            json.dump(metadata, f, indent = 2)
+    except IOError :
+        raise AnalysisError('IOError', f'No such file or directory : {path_analysis_anonym}')
+
+########################################################################################################################################################  
+
+def run(args, seed, parallel = True):
+    """ Run part1 for one anonymized folder (analysis_anonym_meth1_part1.py and the sweep), return the normalized dissimilarities
+    (first replicate with args.replicates)
+    Arguments:
+    args = parsed arguments of analysis_anonym_meth1_part1.py (see its get_arguments)
+    seed = seed of the run
+    parallel = use the OpenMP threads of dtaidistance (False when several runs share the cores) """
+    
+    window_comparison = None
+    if args.window is not None and args.compare_unconstrained :
+        print(f'BEGIN : Compare DTW distances with a window of {args.window} and unconstrained DTW distances on 100 random pairs. \n')
+        store_pa, store_pr = load_cohort(args.path_pa), load_cohort(args.path_pr)
+        with metrics.stage('compare_window'):
+            window_comparison = compare_window(store_pa, store_pr, args.window, seed = seed)
+        print(f"WINDOW : {100 * window_comparison['unchanged_distances']:.1f}% of the distances unchanged, banded / unconstrained distance = "
+              f"{window_comparison['mean_ratio']:.3f} on average (max {window_comparison['max_ratio']:.3f}), rank correlation of DTWm = {window_comparison['DTWm_rank_correlation']:.3f} \n")
+    recall = None
+    if args.reference == 'screened' and args.screening_recall :
+        print(f'BEGIN : Compare the screened search (top {args.top_k}) with the exact search on 100 anonymized patients. \n')
+        store_pa, store_pr = load_cohort(args.path_pa), load_cohort(args.path_pr)
+        with metrics.stage('screening_recall'):
+            scales = channel_scales(store_pr, args.channel_scale) if args.dtw_mode == 'dependent' else None
+            recall = screening_recall(store_pa, ReferenceIndex(store_pr), PAAIndex(store_pr), args.top_k, args.window, seed = seed, mode = args.dtw_mode, scales = scales)
+        print(f"RECALL : exact nearest original found for {100 * recall['recall']:.1f}% of {recall['n_patients']} anonymized patients, "
+              f"relative error of the minimum DTWm = {recall['mean_relative_error']:.4f} on average (max {recall['max_relative_error']:.4f}) \n")
+    mode_comparison = None
+    if args.compare_modes :
+        print('BEGIN : Compare the independent and the dependent multivariate DTW on 100 anonymized patients and 10 random real patients each. \n')
+        store_pa, store_pr = load_cohort(args.path_pa), load_cohort(args.path_pr)
+        with metrics.stage('compare_modes'):
+            mode_comparison = compare_modes(store_pa, store_pr, channel_scales(store_pr, args.channel_scale), args.window, seed = seed)
+        quantiles = {mode: ', '.join(f'{v:.2f}' for v in mode_comparison['dissim_norm_quantiles'][mode].values()) for mode in ('independent', 'dependent')}
+        print(f"MODES : dependent DTW {mode_comparison['speedup']:.1f}x faster, same nearest original for {100 * mode_comparison['same_nearest_original']:.1f}% of the patients, "
+              f"rank correlation of the minimum DTWm = {mode_comparison['DTWm_rank_correlation']:.3f} \n"
+              f"        normalized dissimilarities (p5, p25, median, p75, p95) : independent {quantiles['independent']}, dependent {quantiles['dependent']}, "
+              f"KS = {mode_comparison['KS_statistic']:.3f} (p = {mode_comparison['KS_pvalue']:.3g}) \n")
+    
+    if args.replicates is not None :
+        print(f'BEGIN : Calculate the full matrix of multivariate DTW distances and draw {args.replicates} replicates of 10 random real patients. \n')
+        with metrics.stage('replicates'):
+            dissim_norm = DTWm_replicates(args.path_pr, args.path_pa, args.path_analysis_anonym, args.filename_csv, seed, args.replicates, args.window, args.dtw_cache, args.dtw_cache_size, args.columnar,
+                                          args.dtw_mode, args.channel_scale, parallel)[0]
+        # Written once the results are, so that it always describes them (a failed run leaves the metadata of the previous one)
+        write_metadata(args.path_analysis_anonym, args.filename_csv, args, seed, window_comparison, recall, mode_comparison)
+        return dissim_norm
+    
+    file_records = records_file(args.path_analysis_anonym, args.filename_csv)
+    print(f'BEGIN : Calculate the 1000 univariate, multivariate DTW distances and append the minimum DTWm of each anonymized patient to {file_records}. \n')
+    print('Note : This script takes around 1m20.')
+    DTWu_m_minimum(args.path_pr, args.path_pa, file_records, seed, args.workers, args.reference, args.window, args.max_dist, args.top_k, args.resume, args.dtw_cache, args.dtw_cache_size,
+                   args.io_threads, args.prefetch_depth, args.dtw_mode, args.channel_scale, parallel) # Run the DTWu_m_minimum function
+
+    print('BEGIN : Calculate the distribution of the 1000 minimum DTWm. \n') 
+    with metrics.stage('normalize'):
+        dissim_norm = normalize_DTWm_min(args.path_analysis_anonym, args.filename_csv, args.columnar) # Rn the normalize_DTWm_min function
+    write_metadata(args.path_analysis_anonym, args.filename_csv, args, seed, window_comparison, recall, mode_comparison)
+    return dissim_norm
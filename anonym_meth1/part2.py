@@ -0,0 +1,140 @@
+###############################################################################
+# Part2 of the analysis : statistical values (avg, std, med, min, max) of    #
+#  each physiological parameter for anonymized and real patients            #
+###############################################################################
+
+# Import libraries
+import os, re, glob, time
+import pandas as pd
+from anonym_meth1 import metrics
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.cohort_store import load_cohort, CHANNELS
+from anonym_meth1.series_stats import cohort_statistics, cached_statistics, STATISTICS
+from anonym_meth1.streaming_stats import streaming_statistics
+from anonym_meth1.results_file import results_file, update_results, statistics_arrays, STATS_CSV
+
+# Statistics cache of a cohort, saved in the analysis folder (role : 'anonym' or 'real')
+STATS_CACHE = 'stats_cache_meth1_{}.npz'
+
+########################################################################################################################################################
+
+def get_list_series(path_pr, path_pa):
+    """Return lists of 'series' files for real and anonymized patients 
+    Argument:
+    path_pr = path of original folder
+    path_pa = path of anonymized folder """
+    
+    try:
+        # Check files into the original and anonymized folders 
+        list_pr_multi = glob.glob(os.path.join(path_pr, "*.txt")) # Original folder 
+        list_pa_multi = glob.glob(os.path.join(path_pa, "*.txt")) # Anonymized folder 
+        list_pr_series, list_pa_series = [], [] # Creation of empty lists to add series' files inside
+
+        for files_pa in list_pr_multi:     # For real patients 
+            if files_pa.endswith("_series.txt"):
+                list_pr_series.append(files_pa)
+     
+        for files_pa in list_pa_multi:      # For anonymized ones
+            if files_pa.endswith("_series.txt"):
+                list_pa_series.append(files_pa)
+        
+        # Sort series' lists by ascending order   
+        list_pa_series.sort(key = lambda f: int(re.sub(r'\D', '', f)))  
+        list_pr_series.sort(key = lambda f: int(re.sub(r'\D', '', f))) 
+            
+    except FileNotFoundError:
+        raise AnalysisError('FileNotFoundError', f'Impossible to open at least one of the folders : {path_pr} and/or {path_pa}')
+        
+    return list_pr_series, list_pa_series
+
+
+#######################################################################################################################################################
+
+def get_statistics(store, path_cache, role):
+    """ Return the statistics of a cohort (see cohort_statistics), reusing the cached ones of unchanged series files when path_cache is given
+    Arguments:
+    store = CohortStore of the cohort
+    path_cache = folder of the statistics cache (None : no cache)
+    role = 'anonym' or 'real' (name of the cache file) """
+    
+    if path_cache is None :
+        return cohort_statistics(store)
+    stats, n_recomputed = cached_statistics(store, os.path.join(path_cache, STATS_CACHE.format(role)))
+    print(f'STATS CACHE : {n_recomputed} of {len(store)} {role} patients recomputed')
+    return stats
+
+
+def original_statistics(path_pr, path_cache = None):
+    """ Return the statistics of the real patients (see cohort_statistics), computed once and shared by several anonymized folders
+    Arguments:
+    path_pr = path of the original folder
+    path_cache = folder of the statistics cache (None : no cache) """
+    
+    list_pr_series, _ = get_list_series(path_pr, path_pr)
+    return get_statistics(load_cohort(path_pr, list_pr_series), path_cache, 'real')
+
+
+def get_streaming_statistics(list_series, median, role):
+    """ Return the statistics of a cohort (see cohort_statistics) computed file by file, chunk by chunk (see streaming_statistics)
+    Arguments:
+    list_series = list of 'series' files
+    median = 'exact' or 'approx'
+    role = 'anonym' or 'real' (printed) """
+    
+    try :
+        stats, max_bound = streaming_statistics(list_series, median)
+    except (ValueError, pd.errors.ParserError) as error :
+        raise AnalysisError('ValueError', f'Impossible to read the series files of the {role} patients : {error}')
+    print(f'STREAMING : statistics of {len(list_series)} {role} patients, median {median}' + (f' (error at most {max_bound:.6g})' if median == 'approx' else ''))
+    return stats
+
+
+def calculate_values(path_pr, path_pa, path_analysis_anonym, val_prop, val_perturb, stats_pr = None, stats_cache = True, columnar = False, streaming = None): 
+    """ Calculate means, standard deviations, medians, minimum and maximum values of each parameter for every anonymized 
+    and real patient, save them into 20 csv files (one per statistic and parameter) or into the results file of the configuration, 
+    and return them as (anonymized statistics, real statistics), each {statistic: {parameter: one value per patient}}
+    Arguments:
+    path_pr = path of the original folder
+    path_pa = path of the anonymized folder
+    path_analysis_anonym = path of the analysis_anonymized folder
+    val_prop = value of the proportional level tested
+    val_perturb = value of the perturbation level tested
+    stats_pr = statistics of the real patients already computed (see original_statistics), None to compute them
+    stats_cache = reuse the statistics of unchanged series files, saved in path_analysis_anonym (see cached_statistics)
+    columnar = save the statistical values into the results file of path_analysis_anonym (see anonym_meth1.results_file)
+    streaming = read the series files chunk by chunk, with an 'exact' or 'approx' median (None : whole files through the cohort store) """
+    
+    # Read anonymized and real time series once
+    with metrics.stage('list_files'):
+        list_pr_series, list_pa_series = get_list_series(path_pr, path_pa) # Get series' lists* 
+    
+    # Statistics of all the patients, for the four parameters : {statistic: {parameter: one value per patient}}
+    if streaming is not None : # Constant memory per file, no cohort store nor statistics cache
+        with metrics.stage('statistics'):
+            if stats_pr is None :
+                stats_pr = get_streaming_statistics(list_pr_series, streaming, 'real')
+            stats_pa = get_streaming_statistics(list_pa_series, streaming, 'anonym')
+    else :
+        with metrics.stage('load_cohort'):
+            store_pa = load_cohort(path_pa, list_pa_series) # Binary store shared with part1 (no CSV parsing when up to date)
+            store_pr = load_cohort(path_pr, list_pr_series) if stats_pr is None else None
+        path_cache = path_analysis_anonym if stats_cache else None
+        with metrics.stage('statistics'):
+            if stats_pr is None :
+                stats_pr = get_statistics(store_pr, path_cache, 'real')
+            stats_pa = get_statistics(store_pa, path_cache, 'anonym')
+    n_rows = min(len(list_pa_series), len(stats_pr['avg']['FC'])) # One row per pair of anonymized and real patients (as the former merge on the index)
+    
+    with metrics.stage('write_output'):
+        if columnar :
+            update_results(results_file(path_analysis_anonym), statistics_arrays(stats_pa, stats_pr),
+                           {'prop_level': val_prop, 'perturb_level': val_perturb, 'part2': {'path_pr': path_pr, 'path_pa': path_pa, 'n_rows': n_rows, 'time': time.time()}})
+            return stats_pa, stats_pr
+        
+        # Save files : <stat>_values_meth1_<param>_prop-level_<val_prop>_perturb-level_<val_perturb>.csv (columns <stat>_anonym, <stat>_real)
+        for stat in STATISTICS :
+            for param in CHANNELS :
+                df_stat = pd.DataFrame({f'{stat}_anonym': stats_pa[stat][param][:n_rows], f'{stat}_real': stats_pr[stat][param][:n_rows]})
+                df_stat.to_csv(os.path.join(path_analysis_anonym, STATS_CSV.format(stat, param, val_prop, val_perturb)), sep = ',', index = False)
+    
+    return stats_pa, stats_pr
@@ -0,0 +1,96 @@
+###############################################################################
+# Part3 of the analysis : Kolmogorov-Smirnov and Mann-Whitney U tests of the #
+#  statistical values of part2, and csv export of the results file          #
+###############################################################################
+
+# Import libraries
+import os
+import pandas as pd
+from anonym_meth1 import metrics
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.stat_tests import test_folder, test_table, TEST_COLUMNS
+from anonym_meth1.results_file import results_file, update_results, export_csv, TESTS_CSV
+
+# Generate the 'tests_meth1_<param_physio>_avg_<par>_<valeur>.csv x4 (one per param_phy) x4 (one per pair of prop-/perturb-levels)
+
+########################################################################################################################################################
+
+def tests_KS_WMW_up(path_analysis_anonym, param_physio, val_prop, val_perturb, columnar = False):
+    """ Perform Kolmogorow-Smirnov and Mann-Whitney U tests for each statistical value (avg, std, med, min & max)
+    from the given physiological and valued parameters (passed as arguments of the command line)
+    Note : our anonymization method is an unpaired method
+    Arguments:
+    path_analysis_anonym = path of the analysis_anonymized folder
+    param_physio = physiological parameter that want to be analyzed (FC, PAS, PAM, PAD)
+    val_prop = value of the proportion level
+    val_perturb = value of the perturbation level
+    columnar = read the statistical values from the results file of the analysis folder and save the results into it (see anonym_meth1.results_file)
+    Return the results table of the parameter (one row per statistical value, see anonym_meth1.stat_tests.test_folder)
+    """
+    try :
+        # Read the five files of the parameter and test them together (one KS and one WMW call for the five statistics)
+        results = test_folder(path_analysis_anonym, param_physio, val_prop, val_perturb, columnar) 
+        missing = {'avg', 'std', 'med', 'min', 'max'} - set(results['statistic'])
+        if missing :
+            raise AnalysisError('FileNotFoundError', f'No such file or directory : {sorted(missing)} values of {param_physio} in {path_analysis_anonym}')
+        
+        if columnar :
+            with metrics.stage('write_output'):
+                update_results(results_file(path_analysis_anonym), {f'tests_{param_physio}_{row["statistic"]}': row[list(TEST_COLUMNS)].to_numpy(dtype = float) 
+                                                                    for _, row in results.iterrows()}, {})
+            return results
+        
+        # Save the results of each statistic as a csv file with headers : statKS, pvalKS, statWMW_up, pvalWMW_up and delimiters as commas
+        with metrics.stage('write_output'):
+            for _, row in results.iterrows() :
+                result = pd.DataFrame({column: [row[column]] for column in TEST_COLUMNS})
+                result.to_csv(os.path.join(path_analysis_anonym, TESTS_CSV.format(param_physio, row["statistic"], val_prop, val_perturb)), header = True, sep = ',', index = False)
+        
+        return results
+
+    except TypeError :
+        raise AnalysisError('TypeError', 'Error when trying to merge dataframes or wrong type of passed arguments.')
+    
+    except ValueError:
+        raise AnalysisError('ValueError', 'NaN values might be present in some dataframes.')
+
+#######################################################################################################################################################
+
+def tests_batch(folders, file_output, workers = 1, correction = 'holm', columnar = False):
+    """ Perform Kolmogorow-Smirnov and Mann-Whitney U tests for every physiological parameter, statistical value and configuration
+    of several analysis folders, save them into one table (one row per test) with p-values adjusted for multiple comparisons and return it
+    Arguments:
+    folders = list of analysis_anonym_meth1 folders
+    file_output = path of the results table
+    workers = number of processes sharing the folders
+    correction = multiple-comparison correction over the whole table (see anonym_meth1.stat_tests.adjust_pvalues)
+    columnar = read the statistical values from the results files of the folders whenever they hold them """
+    
+    try :
+        table = test_table(folders, workers, correction, columnar)
+        with metrics.stage('write_output'):
+            table.to_csv(file_output, sep = ',', index = False)
+    except FileNotFoundError :
+        raise AnalysisError('FileNotFoundError', f'No such file or directory : {folders} or {file_output}')
+    except ValueError :
+        raise AnalysisError('ValueError', 'NaN values might be present in some dataframes.')
+    print(f'TESTS : {len(table)} tests saved into {file_output}, {int((table["pvalKS_adj"] < 0.05).sum())} KS and '
+          f'{int((table["pvalWMW_up_adj"] < 0.05).sum())} WMW adjusted p-values below 0.05 ({correction}) \n')
+    return table
+
+
+def export_folders(folders):
+    """ Write the csv files of the former layout from the results file of several analysis folders (see anonym_meth1.results_file.export_csv),
+    return the number of files written into each folder
+    Argument:
+    folders = list of analysis_anonym_meth1 folders """
+    
+    counts = []
+    for folder in folders :
+        try :
+            n_files = export_csv(folder)
+        except FileNotFoundError :
+            raise AnalysisError('FileNotFoundError', f'No such file or directory : {results_file(folder)}')
+        print(f'EXPORT : {n_files} csv files written into {folder} \n')
+        counts.append(n_files)
+    return counts
@@ -0,0 +1,90 @@
+###############################################################################
+# Read-ahead of series : a bounded pool of I/O threads loads the next items  #
+#  while the caller computes on the loaded ones (producer / consumer)        #
+###############################################################################
+
+# Import libraries
+import time, itertools, collections
+from concurrent.futures import ThreadPoolExecutor
+
+from anonym_meth1 import metrics
+
+# Default number of loaded items waiting for the consumer, per I/O thread (backpressure : the memory used stays bounded)
+DEPTH_PER_THREAD = 2
+
+########################################################################################################################################################
+
+class Prefetcher:
+    """ Iterate over (item, load(item)) in the order of the items, load(item) running in a pool of I/O threads ahead of the consumer.
+    At most depth items are loaded or being loaded beyond the one in use : a slow consumer stops the reads instead of filling the memory.
+    The reads (file parsing, page faults of memory-mapped arrays) release the GIL, so they overlap with the computations of the consumer. """
+
+    def __init__(self, load, items, threads = 2, depth = None):
+        self.load = load
+        self.items = list(items)
+        self.threads = threads
+        self.depth = depth if depth is not None else DEPTH_PER_THREAD * threads
+        self.load_s = 0.0 # Time spent reading by the I/O threads (sum over the threads)
+        self.wait_s = 0.0 # Time the consumer waited for an item not loaded yet
+        self.n_loaded = 0
+
+    def timed_load(self, item):
+        start = time.perf_counter()
+        value = self.load(item)
+        return value, time.perf_counter() - start
+
+    def __iter__(self):
+        items = iter(self.items)
+        queued = collections.deque()
+        with ThreadPoolExecutor(self.threads, thread_name_prefix = 'prefetch') as pool:
+            try:
+                for item in itertools.islice(items, self.depth):
+                    queued.append((item, pool.submit(self.timed_load, item)))
+                while queued:
+                    item, future = queued.popleft()
+                    start = time.perf_counter()
+                    value, load_s = future.result()
+                    self.wait_s += time.perf_counter() - start
+                    self.load_s += load_s
+                    self.n_loaded += 1
+                    for following in itertools.islice(items, 1): # One item consumed : one more read
+                        queued.append((following, pool.submit(self.timed_load, following)))
+                    yield item, value
+            finally: # Consumer stopped early (error) : the queued reads are dropped
+                for _, future in queued:
+                    future.cancel()
+        metrics.count('io_load_s', self.load_s)
+        metrics.count('io_wait_s', self.wait_s)
+
+    def summary(self):
+        """ Return the counters of the reads as a dictionary (threads, depth, items, load_s, wait_s) """
+
+        return {'threads': self.threads, 'depth': self.depth, 'items': self.n_loaded, 'load_s': self.load_s, 'wait_s': self.wait_s}
+
+########################################################################################################################################################
+
+class LoadedPatients:
+    """ View of a CohortStore whose given patients are served from copies already in memory (read ahead by a Prefetcher),
+    the other patients and every other attribute coming from the store
+    Arguments:
+    store = CohortStore
+    patients = dictionary : patient index --> tuple of the 4 series (FC, PAS, PAM, PAD) """
+
+    def __init__(self, store, patients):
+        self.store = store
+        self.patients = patients
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def patient(self, i):
+        return self.patients[i] if i in self.patients else self.store.patient(i)
+
+
+def copy_patient(store, i):
+    """ Return a copy in memory of the 4 series of patient i of a store (reads the pages of the memory-mapped arrays) """
+
+    return tuple(s.copy() for s in store.patient(i))
@@ -0,0 +1,138 @@
+###############################################################################
+# Per-patient results of part1 : one JSON record per anonymized patient,     #
+#  appended as the run goes (JSON lines), so that a run can be resumed       #
+###############################################################################
+
+# Import libraries
+import os, json
+
+from anonym_meth1 import metrics
+from anonym_meth1.cohort_store import CHANNELS
+
+# Number of records written between two fsync of the records file
+FSYNC_EVERY = 50
+
+########################################################################################################################################################
+
+def records_file(path_analysis_anonym, filename_csv):
+    """ Return the records file of a run : <filename>_DTWm_records.jsonl in the analysis_anonym_meth1 folder
+    Arguments:
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder
+    filename_csv = output filename of normalized dissimilarities """
+
+    return os.path.join(path_analysis_anonym, f'{os.path.splitext(filename_csv)[0]}_DTWm_records.jsonl')
+
+
+def patient_record(store_pa, store_pr, pa, DTWm, originals, distances):
+    """ Return the record of one anonymized patient : its position and ID, the IDs of the real patients it was compared with
+    (all the drawn ones in random mode, the nearest one otherwise), their per-channel distances (None when abandoned), or their distances
+    under the key 'dependent' with the dependent DTW, and the minimum DTWm
+    Arguments:
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    pa = index of the anonymized patient in store_pa
+    DTWm = minimum DTWm of the patient
+    originals = indices of the real patients in store_pr
+    distances = (4, len(originals)) univariate distances (nan when abandoned), or (1, len(originals)) dependent distances """
+
+    channels = CHANNELS if len(distances) == len(CHANNELS) else ('dependent',)
+    return {'index': int(pa), 'patient': int(store_pa.ids[pa]), 'originals': [int(store_pr.ids[pr]) for pr in originals],
+            'distances': {c: [float(d) if d == d else None for d in distances[i]] for i, c in enumerate(channels)},
+            'DTWm': float(DTWm)}
+
+
+def read_records(file):
+    """ Return (settings, records, size) of a records file : settings of the run (first line), list of the complete records and
+    size in bytes of the complete lines (a last line cut by a crash is ignored)
+    Argument:
+    file = records file """
+
+    settings, records, size = None, [], 0
+    with open(file, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'): # Cut by a crash during the write
+                break
+            try:
+                item = json.loads(line)
+            except ValueError:
+                break
+            if settings is None:
+                settings = item['settings']
+            else:
+                records.append(item)
+            size += len(line)
+    metrics.count('files_read')
+    metrics.count('bytes_read', size)
+    return settings, records, size
+
+
+def records_seed(file):
+    """ Return the seed written in the settings of a records file, None if the file does not exist or has no settings
+    Argument:
+    file = records file """
+
+    if not os.path.isfile(file):
+        return None
+    try:
+        settings = read_records(file)[0]
+    except (IOError, KeyError, TypeError):
+        return None
+    return settings.get('seed') if settings else None
+
+
+def read_DTWm_minimum(file):
+    """ Return the list of minimum DTWm of a records file, in the order of the anonymized patients
+    Argument:
+    file = records file """
+
+    _, records, _ = read_records(file)
+    return [record['DTWm'] for record in sorted(records, key = lambda record: record['index'])]
+
+########################################################################################################################################################
+
+class RecordWriter:
+    """ Append the records of a run to its records file, with an fsync every FSYNC_EVERY records. With resume, the complete records
+    of a previous run with the same settings are kept (done = their indices), otherwise the file is started again """
+
+    def __init__(self, file, settings, resume = False, fsync_every = FSYNC_EVERY):
+        self.file = file
+        self.fsync_every = fsync_every
+        self.done = set()
+        size = 0
+        if resume and os.path.isfile(file):
+            previous, records, size = read_records(file)
+            if previous is not None and previous != settings:
+                raise ValueError(f'{file} was written with other settings ({previous}), cannot resume with {settings}')
+            self.done = {record['index'] for record in records}
+        if size == 0:
+            self.f = open(file, 'w')
+            self.write_line({'settings': settings})
+        else:
+            self.f = open(file, 'r+')
+            self.f.truncate(size) # Drop a line cut by a crash
+            self.f.seek(size)
+        self.pending = 0
+
+    def write_line(self, item):
+        self.f.write(json.dumps(item) + '\n')
+
+    def write(self, record):
+        """ Append one record (fsync every fsync_every records) """
+        self.write_line(record)
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,104 @@
+###############################################################################
+# Monte Carlo replicates : full anonymized x original DTWm matrix computed   #
+#  (or loaded from cache) once, then K cheap resamplings of 10 originals     #
+###############################################################################
+
+# Import libraries
+import os, json, hashlib
+import numpy as np
+
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.dtw_engine import distance_block, DTWm_block
+
+########################################################################################################################################################
+
+def DTWm_matrix(store_pa, store_pr, parallel = True, window = None, cache = None, mode = 'independent', scales = None):
+    """ Return the (n_pa, n_pr) matrix of multivariate DTW distances between all anonymized and all original patients
+    Arguments:
+    store_pa = cohort store of the anonymized folder
+    store_pr = cohort store of the original folder
+    parallel = use the OpenMP threads of dtaidistance
+    window = Sakoe-Chiba window (None : no window)
+    cache = DistanceCache of univariate distances (None : no cache)
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+
+    pa_patients = [store_pa.patient(i) for i in range(len(store_pa))]
+    pr_patients = [store_pr.patient(i) for i in range(len(store_pr))]
+    return DTWm_block(distance_block(pa_patients, pr_patients, parallel = parallel, window = window, cache = cache, mode = mode, scales = scales))
+
+
+def matrix_cache_file(path_cache, store_pa, store_pr, dtw_settings = None):
+    """ Return the cache file of the DTWm matrix of two cohorts : its name depends on both sets of source files and on the DTW settings
+    Arguments:
+    path_cache = folder of the cached matrices (e.g., the analysis_anonym_meth1 folder)
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    dtw_settings = dictionary of the DTW settings used to compute the matrix """
+
+    key = json.dumps([store_pa.fingerprint(), store_pr.fingerprint(), dtw_settings or {}], sort_keys = True)
+    return os.path.join(path_cache, f'DTWm_matrix_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npy')
+
+
+def load_DTWm_matrix(path_cache, store_pa, store_pr, parallel = True, window = None, cache = None, mode = 'independent', scales = None):
+    """ Return the DTWm matrix of two cohorts, from the cache when it exists, otherwise computed and saved into the cache
+    Arguments:
+    path_cache = folder of the cached matrices
+    store_pa, store_pr = cohort stores of the anonymized and original folders
+    parallel = use the OpenMP threads of dtaidistance
+    window = Sakoe-Chiba window (None : no window)
+    cache = DistanceCache of univariate distances, used when the matrix itself is not cached (None : no cache)
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+
+    dtw_settings = {'window': window}
+    if mode == 'dependent': # The matrices of the independent mode keep their former names
+        dtw_settings.update(mode = mode, scales = np.asarray(scales if scales is not None else np.ones(len(CHANNELS)), dtype = float).tolist())
+    file_cache = matrix_cache_file(path_cache, store_pa, store_pr, dtw_settings)
+    if os.path.isfile(file_cache):
+        print(f'CACHE : DTWm matrix loaded from {file_cache}')
+        return np.load(file_cache)
+
+    matrix = DTWm_matrix(store_pa, store_pr, parallel = parallel, window = window, cache = cache, mode = mode, scales = scales)
+    np.save(f'{file_cache}.tmp.npy', matrix)
+    os.replace(f'{file_cache}.tmp.npy', file_cache) # A matrix is only visible once fully written
+    return matrix
+
+########################################################################################################################################################
+
+def replicate_minima(matrix, n_replicates, rng, n_sample = 10):
+    """ Return the (n_replicates, n_pa) minimum DTWm of each anonymized patient over n_sample original patients drawn
+    at random (without replacement) in each replicate
+    Arguments:
+    matrix = (n_pa, n_pr) DTWm matrix
+    n_replicates = number of replicates (K)
+    rng = np.random.Generator
+    n_sample = number of original patients drawn for each anonymized patient """
+
+    n_pa, n_pr = matrix.shape
+    minima = np.empty((n_replicates, n_pa))
+    for k in range(n_replicates):
+        # The n_sample smallest of n_pr random keys give a uniform random subset of the original patients, for every row at once
+        drawn = np.argpartition(rng.random((n_pa, n_pr)), n_sample - 1, axis = 1)[:, :n_sample]
+        minima[k] = np.take_along_axis(matrix, drawn, axis = 1).min(axis = 1)
+    return minima
+
+
+def normalize_minima(minima):
+    """ Return the normalized dissimilarities (x - E) / S of each row of minimum DTWm (E = mean, S = sample standard deviation)
+    Argument:
+    minima = (n_replicates, n_pa) array of minimum DTWm """
+
+    mean_E = minima.mean(axis = 1, keepdims = True)
+    standev_S = minima.std(axis = 1, ddof = 1, keepdims = True)
+    return (minima - mean_E) / standev_S
+
+
+def replicate_spread(minima, dissim_norm):
+    """ Return a dictionary of per-replicate summaries (columns) : E, S and quantiles of the normalized dissimilarities
+    Arguments:
+    minima = (n_replicates, n_pa) array of minimum DTWm
+    dissim_norm = normalized dissimilarities returned by normalize_minima """
+
+    quantiles = np.quantile(dissim_norm, [0.05, 0.25, 0.5, 0.75, 0.95], axis = 1)
+    return {'replicate': np.arange(1, len(minima) + 1), 'mean_E': minima.mean(axis = 1), 'standev_S': minima.std(axis = 1, ddof = 1),
+            'q05': quantiles[0], 'q25': quantiles[1], 'median': quantiles[2], 'q75': quantiles[3], 'q95': quantiles[4]}
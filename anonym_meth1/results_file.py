@@ -0,0 +1,112 @@
+###############################################################################
+# Columnar results of one configuration : statistics, tests and normalized   #
+#  dissimilarities of part1-3 in one .npz file of the analysis folder        #
+###############################################################################
+
+# Import libraries
+import os, json
+import numpy as np
+# pandas is imported by the functions using it, so that the scripts start fast (--help, parsing of the arguments)
+
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.series_stats import STATISTICS
+
+# Results file of a configuration, in its analysis folder
+RESULTS_FILE = 'results_meth1.npz'
+RESULTS_VERSION = 1
+
+# Csv files of the former layout, written again by export_csv (part2 : statistical values, part3 : tests)
+STATS_CSV = '{}_values_meth1_{}_prop-level_{}_perturb-level_{}.csv'
+TESTS_CSV = 'test_meth1_{}_{}_prop-level_{}_perturb-level_{}.csv'
+
+# Results of one test, in the order of the one-row csv files of part3
+TEST_COLUMNS = ('statKS', 'pvalKS', 'statWMW_up', 'pvalWMW_up')
+
+# Arrays of the results file (name --> description), saved into the metadata of the file
+SCHEMA = {'dissim_norm': 'normalized dissimilarities of the anonymized patients (part1)',
+          '<stat>_anonym_<param>': 'statistical value (avg, std, med, min, max) of each anonymized patient for one parameter (part2)',
+          '<stat>_real_<param>': 'statistical value of each real patient for one parameter (part2)',
+          'tests_<param>_<stat>': 'statKS, pvalKS, statWMW_up, pvalWMW_up of one parameter and statistical value (part3)'}
+
+########################################################################################################################################################
+
+def results_file(path_analysis_anonym):
+    """ Return the results file of the configuration of an analysis folder
+    Argument:
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder """
+
+    return os.path.join(path_analysis_anonym, RESULTS_FILE)
+
+
+def read_results(file, names = None):
+    """ Return (arrays, metadata) of a results file, both empty dictionaries if the file does not exist
+    Arguments:
+    file = results file
+    names = only read these arrays (None : all of them) """
+
+    if not os.path.isfile(file):
+        return {}, {}
+    with np.load(file) as results: # Lazy : only the requested arrays are read
+        arrays = {name: results[name] for name in results.files if name != 'metadata' and (names is None or name in names)}
+        metadata = json.loads(str(results['metadata'])) if 'metadata' in results.files else {}
+    return arrays, metadata
+
+
+def update_results(file, arrays, metadata):
+    """ Add (or replace) arrays and metadata entries in a results file, created if missing (each script adds its own part)
+    Arguments:
+    file = results file
+    arrays = dictionary name --> numpy array
+    metadata = dictionary of metadata entries (JSON-serializable) """
+
+    previous_arrays, previous_metadata = read_results(file)
+    previous_arrays.update(arrays)
+    previous_metadata.update(metadata, version = RESULTS_VERSION, schema = SCHEMA, channels = list(CHANNELS))
+    with open(f'{file}.tmp', 'wb') as f:
+        np.savez(f, metadata = np.array(json.dumps(previous_metadata)), **previous_arrays)
+    os.replace(f'{file}.tmp', file) # The file is only visible once fully written
+
+########################################################################################################################################################
+
+def statistics_arrays(stats_pa, stats_pr):
+    """ Return the arrays of the statistics of part2 (see SCHEMA), one row per pair of anonymized and real patients as in its csv files
+    Arguments:
+    stats_pa, stats_pr = statistics of the anonymized and real patients (see cohort_statistics) """
+
+    arrays = {}
+    for stat in stats_pa:
+        for param in CHANNELS:
+            n_rows = min(len(stats_pa[stat][param]), len(stats_pr[stat][param]))
+            arrays[f'{stat}_anonym_{param}'] = stats_pa[stat][param][:n_rows]
+            arrays[f'{stat}_real_{param}'] = stats_pr[stat][param][:n_rows]
+    return arrays
+
+
+def export_csv(path_analysis_anonym):
+    """ Write the csv files of the former layout (distribution of part1 and its metadata, statistical values of part2, tests of part3)
+    from the results file of an analysis folder, return their number
+    Argument:
+    path_analysis_anonym = path of the analysis_anonym_meth1 folder """
+
+    import pandas as pd
+    arrays, metadata = read_results(results_file(path_analysis_anonym))
+    if not arrays:
+        raise FileNotFoundError(results_file(path_analysis_anonym))
+    n_files = 0
+    if 'dissim_norm' in arrays and 'distribution_csv' in metadata:
+        np.savetxt(os.path.join(path_analysis_anonym, metadata['distribution_csv']), arrays['dissim_norm'], delimiter = ',', header = 'dissim_norm', fmt = '%f', comments = '')
+        with open(os.path.join(path_analysis_anonym, f"{os.path.splitext(metadata['distribution_csv'])[0]}_metadata.json"), 'w') as f:
+            json.dump(metadata['part1'], f, indent = 2)
+        n_files += 2
+    levels = (metadata.get('prop_level'), metadata.get('perturb_level'))
+    for stat in STATISTICS:
+        for param in CHANNELS:
+            if f'{stat}_anonym_{param}' in arrays:
+                df_stat = pd.DataFrame({f'{stat}_anonym': arrays[f'{stat}_anonym_{param}'], f'{stat}_real': arrays[f'{stat}_real_{param}']})
+                df_stat.to_csv(os.path.join(path_analysis_anonym, STATS_CSV.format(stat, param, *levels)), sep = ',', index = False)
+                n_files += 1
+            if f'tests_{param}_{stat}' in arrays:
+                result = pd.DataFrame({column: [value] for column, value in zip(TEST_COLUMNS, arrays[f'tests_{param}_{stat}'])})
+                result.to_csv(os.path.join(path_analysis_anonym, TESTS_CSV.format(param, stat, *levels)), header = True, sep = ',', index = False)
+                n_files += 1
+    return n_files
@@ -0,0 +1,117 @@
+###############################################################################
+# Approximate nearest original patient : candidates ranked by a coarse DTW   #
+#  on piecewise aggregate approximations, top-k refined at full resolution  #
+###############################################################################
+
+# Import libraries
+import numpy as np
+
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.dtw_engine import channel_distance_block, distance_block, DTWm_block, absolute_window, stacked_patient
+from anonym_meth1.nearest import nearest_original
+
+# Number of segments of the piecewise aggregate approximation (PAA) of each series
+PAA_SEGMENTS = 32
+
+########################################################################################################################################################
+
+def paa(series, n_segments = PAA_SEGMENTS):
+    """ Return the piecewise aggregate approximation of a series : mean of n_segments segments of (almost) equal length
+    Arguments:
+    series = 1D array
+    n_segments = number of segments (series shorter than that are returned unchanged) """
+
+    series = np.asarray(series, dtype = np.float64)
+    if len(series) <= n_segments:
+        return series.copy()
+    starts = np.linspace(0, len(series), n_segments + 1).astype(int)[:-1]
+    return np.add.reduceat(series, starts) / np.diff(np.append(starts, len(series)))
+
+
+class PAAIndex:
+    """ Piecewise aggregate approximations of every series of the original cohort, one list per channel """
+
+    def __init__(self, store_pr, n_segments = PAA_SEGMENTS):
+        self.store = store_pr
+        self.n_segments = n_segments
+        self.series = [[paa(store_pr.series(i, c), n_segments) for i in range(len(store_pr))] for c in CHANNELS]
+
+    def __len__(self):
+        return len(self.store)
+
+########################################################################################################################################################
+
+def coarse_DTWm(pa_series, paa_index, window = None, parallel = True, mode = 'independent', scales = None):
+    """ Return the (n_pr,) multivariate DTW distances between the PAA of one anonymized patient and the PAA of all the original patients
+    Arguments:
+    pa_series = tuple of the 4 series of the anonymized patient
+    paa_index = PAAIndex of the original cohort
+    window = Sakoe-Chiba window at full resolution (scaled to the number of segments)
+    parallel = use the OpenMP threads of dtaidistance
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+
+    length = len(pa_series[0])
+    dtw_settings = {}
+    window = absolute_window(window, length)
+    if window is not None:
+        dtw_settings['window'] = max(1, int(np.ceil(window * min(paa_index.n_segments, length) / length)))
+
+    if mode == 'dependent': # One DTW of the 4-dimensional PAA
+        pr_stacked = [stacked_patient([paa_index.series[c][pr] for c in range(len(CHANNELS))], scales) for pr in range(len(paa_index))]
+        pa_stacked = stacked_patient([paa(q, paa_index.n_segments) for q in pa_series], scales)
+        return channel_distance_block([pa_stacked], pr_stacked, parallel = parallel, **dtw_settings)[0]
+
+    distances = np.empty((len(CHANNELS), len(paa_index)))
+    for c, q in enumerate(pa_series):
+        distances[c] = channel_distance_block([paa(q, paa_index.n_segments)], paa_index.series[c], parallel = parallel, **dtw_settings)[0]
+    return distances.mean(axis = 0)
+
+
+def screened_nearest(pa_series, paa_index, top_k, window = None, parallel = True, cache = None, mode = 'independent', scales = None):
+    """ Return (DTWm, index of the original patient, its 4 univariate distances or [dependent distance]) of the approximate nearest original patient :
+    the top_k candidates of the coarse DTW are refined with the full-resolution DTW, the others are never computed
+    Arguments:
+    pa_series = tuple of the 4 series of the anonymized patient
+    paa_index = PAAIndex of the original cohort
+    top_k = number of refined candidates (top_k >= number of original patients gives the exact result)
+    window = Sakoe-Chiba window, in samples or as a fraction of the anonymized series length
+    parallel = use the OpenMP threads of dtaidistance
+    cache = DistanceCache of the full-resolution distances (None : no cache)
+    mode = 'independent' or 'dependent' (see DTW_MODES)
+    scales = with mode = 'dependent', factors dividing the channels (see channel_scales, None : no scaling) """
+
+    survivors = np.argsort(coarse_DTWm(pa_series, paa_index, window, parallel, mode, scales), kind = 'stable')[:top_k]
+    pr_patients = [paa_index.store.patient(pr) for pr in survivors]
+    distances = distance_block([pa_series], pr_patients, parallel = parallel, window = window, cache = cache, mode = mode, scales = scales)
+    list_DTWm = DTWm_block(distances)[0]
+    k = int(np.argmin(list_DTWm))
+    return list_DTWm[k], int(survivors[k]), distances[:, 0, k].tolist()
+
+########################################################################################################################################################
+
+def screening_recall(store_pa, index, paa_index, top_k, window = None, n_patients = 100, seed = 0, mode = 'independent', scales = None):
+    """ Return a dictionary comparing the screened search with the exact search (see nearest_original) on n_patients
+    anonymized patients drawn at random : recall (share of patients whose exact nearest original is found) and relative
+    error of the minimum DTWm
+    Arguments:
+    store_pa = cohort store of the anonymized folder
+    index = ReferenceIndex of the original cohort
+    paa_index = PAAIndex of the same cohort
+    top_k = number of refined candidates
+    window = Sakoe-Chiba window
+    n_patients = number of anonymized patients checked
+    seed = seed of the drawn patients
+    mode, scales = multivariate DTW of both searches (see DTW_MODES and channel_scales) """
+
+    rng = np.random.default_rng(seed)
+    patients = rng.choice(len(store_pa), size = min(n_patients, len(store_pa)), replace = False)
+    exact, screened = [], []
+    for pa in patients:
+        exact.append(nearest_original(store_pa.patient(pa), index, window = window, mode = mode, scales = scales)[0])
+        screened.append(screened_nearest(store_pa.patient(pa), paa_index, top_k, window, mode = mode, scales = scales)[0])
+    exact, screened = np.array(exact), np.array(screened)
+    error = (screened - exact) / np.where(exact > 0, exact, 1.0) # Screening can only miss the nearest patient, never find a closer one
+    return {'n_patients': len(patients), 'top_k': top_k, 'paa_segments': paa_index.n_segments,
+            'recall': float(np.mean(np.isclose(screened, exact, rtol = 1e-12, atol = 0.0))),
+            'mean_relative_error': float(error.mean()), 'max_relative_error': float(error.max())}
@@ -0,0 +1,106 @@
+###############################################################################
+# Per-patient statistics of a cohort (mean, standard deviation, median,      #
+#  minimum & maximum) computed for all patients at once with NumPy          #
+###############################################################################
+
+# Import libraries
+import os
+import numpy as np
+
+from anonym_meth1.cohort_store import CHANNELS
+
+# Statistics of part2, in the order of its output files
+STATISTICS = ('avg', 'std', 'med', 'min', 'max')
+
+########################################################################################################################################################
+
+def segment_statistics(values, offsets):
+    """ Return a dictionary {statistic: array of one value per patient} for one channel of a cohort.
+    The standard deviation is the sample one (n - 1), the median of an even number of values is the mean of the two middle ones
+    (same definitions as statistics.stdev and statistics.median).
+    Arguments:
+    values = 1D array of the values of all the patients, one after the other (see CohortStore.channels)
+    offsets = (n_patients + 1) array of the first value of each patient (the last one is len(values)) """
+
+    values = np.asarray(values, dtype = np.float64)
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    segment = np.repeat(np.arange(len(lengths)), lengths) # Patient of each value
+
+    mean = np.add.reduceat(values, starts) / lengths
+    residuals = np.add.reduceat(values - mean[segment], starts) # Rounding error of the first pass
+    mean += residuals / lengths
+    deviations = values - mean[segment] # Corrected two-pass variance : no cancellation of large squared sums
+    with np.errstate(divide = 'ignore', invalid = 'ignore'): # A single value has no standard deviation (nan)
+        squares = np.add.reduceat(deviations ** 2, starts) - np.add.reduceat(deviations, starts) ** 2 / lengths
+        std = np.sqrt(squares / (lengths - 1))
+
+    # Sort the values of every patient at once (patients stay in their own segment)
+    ordered = values[np.lexsort((values, segment))]
+    low, high = starts + (lengths - 1) // 2, starts + lengths // 2
+    median = (ordered[low] + ordered[high]) / 2
+
+    return {'avg': mean, 'std': std, 'med': median, 'min': ordered[starts], 'max': ordered[offsets[1:] - 1]}
+
+
+def cohort_statistics(store, patients = None):
+    """ Return a dictionary {statistic: {channel: array of one value per patient}} for the four channels of a cohort
+    Arguments:
+    store = CohortStore of the cohort
+    patients = indices of the patients to summarize (None : all of them) """
+
+    offsets = np.asarray(store.offsets)
+    if patients is None:
+        per_channel = {c: segment_statistics(store.channels[c], offsets) for c in CHANNELS}
+    else:
+        # Gather the values of the chosen patients only, one after the other
+        lengths = np.diff(offsets)[patients]
+        sub_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        take = np.repeat(offsets[:-1][patients] - sub_offsets[:-1], lengths) + np.arange(sub_offsets[-1])
+        per_channel = {c: segment_statistics(np.asarray(store.channels[c])[take], sub_offsets) for c in CHANNELS}
+    return {stat: {c: per_channel[c][stat] for c in CHANNELS} for stat in STATISTICS}
+
+########################################################################################################################################################
+
+def statistics_keys(store):
+    """ Return the key of each patient of a cohort in the statistics cache : path, size and modification time of its series file
+    Argument:
+    store = CohortStore of the cohort """
+
+    return [f"{os.path.abspath(f)}|{sig['size']}|{sig['mtime_ns']}" for f, sig in zip(store.files, store.signatures)]
+
+
+def cached_statistics(store, file_cache):
+    """ Return (statistics of a cohort as cohort_statistics, number of recomputed patients). The statistics of the patients whose
+    series file is unchanged are read from the cache file, the others are computed and the cache file is updated
+    Arguments:
+    store = CohortStore of the cohort
+    file_cache = .npz cache file (one column of keys, one column per statistic and channel), created if missing """
+
+    keys = statistics_keys(store)
+    names = [f'{stat}_{c}' for stat in STATISTICS for c in CHANNELS]
+    try:
+        with np.load(file_cache) as cache:
+            cached_keys = cache['keys'].tolist()
+            columns = {name: cache[name] for name in names}
+    except (OSError, ValueError, KeyError): # Missing or unreadable cache : everything is computed
+        cached_keys, columns = [], {}
+
+    index = {k: i for i, k in enumerate(cached_keys)}
+    position = np.array([index.get(k, -1) for k in keys], dtype = np.int64)
+    fresh, stale = np.flatnonzero(position >= 0), np.flatnonzero(position < 0)
+    stats = {stat: {c: np.empty(len(keys)) for c in CHANNELS} for stat in STATISTICS}
+    computed = cohort_statistics(store, stale) if len(stale) > 0 else None
+    for stat in STATISTICS:
+        for c in CHANNELS:
+            stats[stat][c][fresh] = columns[f'{stat}_{c}'][position[fresh]] if len(fresh) > 0 else []
+            if computed is not None:
+                stats[stat][c][stale] = computed[stat][c]
+
+    if keys != cached_keys: # New, modified or removed series files
+        try:
+            with open(f'{file_cache}.tmp', 'wb') as f:
+                np.savez(f, keys = np.array(keys), **{f'{stat}_{c}': stats[stat][c] for stat in STATISTICS for c in CHANNELS})
+            os.replace(f'{file_cache}.tmp', file_cache) # The cache is only visible once fully written
+        except OSError: # Read-only folder : the statistics are still returned
+            pass
+    return stats, len(stale)
@@ -0,0 +1,274 @@
+###############################################################################
+# Resident evaluation service : the original cohort, its envelopes and its   #
+#  statistics stay in memory, anonymized cohorts are evaluated on request    #
+#  (local HTTP server, one thread per request)                               #
+###############################################################################
+
+# Import libraries
+import io, os, json, time, threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.cohort_store import CohortStore, load_cohort, list_series_files, CHANNELS
+from anonym_meth1.series_stats import cohort_statistics, STATISTICS
+from anonym_meth1.stat_tests import batched_tests, adjust_pvalues
+from anonym_meth1.results_file import TEST_COLUMNS
+from anonym_meth1.dtw_engine import channel_scales
+from anonym_meth1.nearest import ReferenceIndex
+from anonym_meth1.screening import PAAIndex
+from anonym_meth1.part1 import DTWm_patient, normalized_dissimilarities
+
+# Default address of the service (local machine only)
+HOST, PORT = '127.0.0.1', 8765
+
+# Content types of the uploaded arrays : JSON list of patients, or .npz file in the layout of a cohort store (offsets + one array per channel)
+JSON_TYPE, NPZ_TYPE = 'application/json', 'application/x-npz'
+
+# Number of request latencies kept for the percentiles of /status
+LATENCY_WINDOW = 1000
+
+########################################################################################################################################################
+
+def uploaded_store(offsets, channels, ids = None):
+    """ Return an in-memory CohortStore of uploaded arrays, after checking their layout
+    Arguments:
+    offsets = (n_patients + 1) offsets of the patients in the channel arrays (starting at 0)
+    channels = dictionary : channel name --> 1D array of the values of all the patients, one after the other
+    ids = patient IDs, used to draw the 10 random real patients of each one (default : 0, 1, ...) """
+
+    try :
+        offsets = np.asarray(offsets, dtype = np.int64)
+        channels = {c: np.array(channels[c], dtype = np.float64) for c in CHANNELS} # Writable copies (required by dtaidistance)
+        ids = np.arange(len(offsets) - 1) if ids is None else np.asarray(ids, dtype = np.int64)
+    except KeyError as e :
+        raise AnalysisError('ValueError', f'Missing channel {e} in the uploaded arrays (expected {list(CHANNELS)})')
+    except (TypeError, ValueError) as e :
+        raise AnalysisError('ValueError', f'Unreadable uploaded arrays : {e}')
+    if offsets.ndim != 1 or len(offsets) < 3 or offsets[0] != 0 or np.any(np.diff(offsets) < 1) :
+        raise AnalysisError('ValueError', 'The offsets must start at 0 and give at least 2 patients of at least 1 value each')
+    if any(values.shape != (offsets[-1],) for values in channels.values()) or len(ids) != len(offsets) - 1 :
+        raise AnalysisError('ValueError', f'Each channel must hold {offsets[-1]} values (last offset) and ids one value per patient')
+    if not all(np.isfinite(values).all() for values in channels.values()) :
+        raise AnalysisError('ValueError', 'The uploaded arrays hold NaN or infinite values')
+    files = [f'{i}_series.txt' for i in ids] # Names giving back the IDs (see patient_id)
+    return CohortStore('<upload>', files, offsets, channels, signatures = [{'name': f, 'size': 0, 'mtime_ns': 0} for f in files])
+
+
+def read_upload(body, content_type):
+    """ Return (CohortStore, fields of the request) of an uploaded cohort
+    Arguments:
+    body = bytes of the request
+    content_type = JSON_TYPE ({"patients": [{"FC": [...], "PAS": [...], "PAM": [...], "PAD": [...]}, ...], "ids": [...]} or {"path_pa": ...})
+                   or NPZ_TYPE (arrays offsets, FC, PAS, PAM, PAD and optionally ids) """
+
+    if content_type == NPZ_TYPE :
+        try :
+            with np.load(io.BytesIO(body)) as arrays :
+                return uploaded_store(arrays['offsets'], arrays, arrays['ids'] if 'ids' in arrays else None), {}
+        except (OSError, ValueError) as e :
+            raise AnalysisError('ValueError', f'Unreadable .npz upload : {e}')
+        except KeyError :
+            raise AnalysisError('ValueError', 'The .npz upload has no offsets array')
+    try :
+        fields = json.loads(body or b'{}')
+    except ValueError as e :
+        raise AnalysisError('ValueError', f'Unreadable JSON request : {e}')
+    if not isinstance(fields, dict) or ('patients' in fields) == ('path_pa' in fields) :
+        raise AnalysisError('ValueError', 'The request needs either path_pa (anonymized folder) or patients (uploaded arrays)')
+    if 'path_pa' in fields :
+        return None, fields
+    try :
+        patients = fields['patients']
+        lengths = [len(patient['FC']) for patient in patients]
+        if any(len(patient[c]) != length for patient, length in zip(patients, lengths) for c in CHANNELS) :
+            raise ValueError('lists of different lengths')
+        channels = {c: np.concatenate([np.asarray(patient[c], dtype = np.float64) for patient in patients]) if patients else [] for c in CHANNELS}
+    except (KeyError, TypeError, ValueError) as e :
+        raise AnalysisError('ValueError', f'Each patient must have the lists {list(CHANNELS)} of the same length ({e!r})')
+    return uploaded_store(np.concatenate(([0], np.cumsum(lengths))), channels, fields.get('ids')), fields
+
+########################################################################################################################################################
+
+class EvaluationService:
+    """ Original cohort kept in memory (cohort store, per-channel envelopes and first / last values of the lower bounds, PAA of the screening
+    with --reference screened, statistics of part2) and evaluation of anonymized cohorts against it : normalized dissimilarities (part1)
+    and KS / Mann-Whitney U tests of the statistical values (part2 and part3), without writing any file
+    Arguments:
+    path_pr = path of the original folder
+    settings = DTW settings of part1 (seed, reference, window, max_dist, top_k, dtw_mode, channel_scale)
+    correction = multiple-comparison correction of the p-values of a request (see adjust_pvalues)
+    concurrency = number of requests evaluated at the same time, the others wait (their waiting time is reported) """
+
+    def __init__(self, path_pr, settings, correction = 'holm', concurrency = 2):
+        start = time.perf_counter()
+        if not os.path.isdir(path_pr) :
+            raise AnalysisError('FileNotFoundError', f'Impossible to open the folder : {path_pr}')
+        self.path_pr = path_pr
+        self.settings = settings
+        self.correction = correction
+        self.store_pr = load_cohort(path_pr)
+        self.indexes = {'random': None, 'all': ReferenceIndex(self.store_pr)}
+        if settings['reference'] == 'screened' :
+            self.indexes['screened'] = PAAIndex(self.store_pr)
+        self.scales = channel_scales(self.store_pr, settings['channel_scale']) if settings['dtw_mode'] == 'dependent' else None
+        self.stats_pr = cohort_statistics(self.store_pr)
+        self.tests(self.stats_pr) # Imports SciPy now rather than during the first request
+        self.load_s = time.perf_counter() - start
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.concurrency = concurrency
+        self.lock = threading.Lock() # Counters below, updated by the threads of the requests
+        self.n_requests, self.n_errors, self.in_flight, self.latencies = 0, 0, 0, []
+
+    def evaluate(self, store_pa = None, path_pa = None, seed = None, reference = None):
+        """ Return the evaluation of an anonymized cohort as a JSON-serializable dictionary : normalized dissimilarities and minimum DTWm
+        of the anonymized patients, table of the tests (one row per parameter and statistic) and latency of each step of the request
+        Arguments:
+        store_pa = CohortStore of uploaded arrays (see uploaded_store), or None to read path_pa
+        path_pa = path of the anonymized folder (its cohort store is built or reused as by the scripts)
+        seed = seed of the 10 random real patients (default : seed of the service)
+        reference = 'random', 'all' or, when the service was started with it, 'screened' (default : reference of the service) """
+
+        try :
+            seed = self.settings['seed'] if seed is None else int(seed)
+            if seed < 0 :
+                raise ValueError(seed)
+        except (TypeError, ValueError) :
+            raise AnalysisError('ValueError', f'The seed must be a non-negative integer, not {seed!r}')
+        reference = self.settings['reference'] if reference is None else reference
+        if reference not in self.indexes :
+            raise AnalysisError('ValueError', f'Unknown reference {reference!r} (one of {list(self.indexes)})')
+        latency = {}
+        start = time.perf_counter()
+        with self.slots :
+            latency['queued_s'] = time.perf_counter() - start
+            step = time.perf_counter()
+            if store_pa is None :
+                if not os.path.isdir(path_pa) :
+                    raise AnalysisError('FileNotFoundError', f'Impossible to open the folder : {path_pa}')
+                list_pa_series = list_series_files(path_pa)
+                if len(list_pa_series) < 2 :
+                    raise AnalysisError('FileNotFoundError', f'Less than 2 series files in {path_pa}')
+                store_pa = load_cohort(path_pa, list_pa_series)
+            latency['load_s'], step = time.perf_counter() - step, time.perf_counter()
+
+            state = dict(self.settings, seed = seed, reference = reference, store_pa = store_pa, store_pr = self.store_pr, index = self.indexes[reference], scales = self.scales, cache = None)
+            DTWm_minimum = [DTWm_patient(state, pa)[0]['DTWm'] for pa in range(len(store_pa))]
+            dissim_norm = normalized_dissimilarities(DTWm_minimum)
+            latency['dtw_s'], step = time.perf_counter() - step, time.perf_counter()
+
+            stats_pa = cohort_statistics(store_pa)
+            latency['statistics_s'], step = time.perf_counter() - step, time.perf_counter()
+            tests = self.tests(stats_pa)
+            latency['tests_s'] = time.perf_counter() - step
+        latency['total_s'] = time.perf_counter() - start
+        return {'path_pa': path_pa, 'n_patients': len(store_pa), 'seed': seed, 'reference': reference, 'window': self.settings['window'], 'dtw_mode': self.settings['dtw_mode'],
+                'dissim_norm': dissim_norm.tolist(), 'DTWm_minimum': DTWm_minimum, 'tests': tests, 'correction': self.correction, 'latency_s': latency}
+
+    def tests(self, stats_pa):
+        """ Return the rows of the KS and Mann-Whitney U tests of every parameter and statistic (same values as part3 on the files of part2 :
+        one value per pair of anonymized and real patients), with the p-values of the request adjusted together
+        Argument:
+        stats_pa = statistics of the anonymized patients (see cohort_statistics) """
+
+        n_rows = min(len(stats_pa['avg']['FC']), len(self.stats_pr['avg']['FC']))
+        keys = sorted((stat, param) for stat in STATISTICS for param in CHANNELS) # Order of the tables of part3
+        results = batched_tests(np.array([stats_pa[stat][param][:n_rows] for stat, param in keys]),
+                                np.array([self.stats_pr[stat][param][:n_rows] for stat, param in keys]))
+        adjusted = adjust_pvalues(np.concatenate((results[:, 1], results[:, 3])), self.correction)
+        return [dict({'param_physio': param, 'statistic': stat}, **{column: float(value) for column, value in zip(TEST_COLUMNS, row)},
+                     pvalKS_adj = float(adjusted[i]), pvalWMW_up_adj = float(adjusted[len(keys) + i]))
+                for i, ((stat, param), row) in enumerate(zip(keys, results))]
+
+    def record(self, latency_s, failed = False):
+        """ Count a finished request and keep its latency """
+
+        with self.lock :
+            self.n_requests += 1
+            self.n_errors += failed
+            self.latencies = (self.latencies + [latency_s])[-LATENCY_WINDOW:]
+
+    def status(self):
+        """ Return the state of the service : original cohort, settings, load time, counters and latencies of the last requests """
+
+        with self.lock :
+            latencies = np.array(self.latencies)
+            counters = {'requests': self.n_requests, 'errors': self.n_errors, 'in_flight': self.in_flight}
+        return {'path_pr': self.path_pr, 'n_originals': len(self.store_pr), 'settings': self.settings, 'references': list(self.indexes),
+                'concurrency': self.concurrency, 'load_s': self.load_s, **counters,
+                'latency_s': {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 99)} if len(latencies) else {}}
+
+########################################################################################################################################################
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """ GET /status : state of the service. POST /evaluate : evaluation of an anonymized cohort given by its folder or uploaded
+    (see read_upload), the seed and the reference being optional fields of the JSON body or parameters of the URL """
+
+    def send_json(self, code, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', JSON_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/status' :
+            return self.send_json(404, {'error': 'NotFound', 'message': 'GET /status or POST /evaluate'})
+        self.send_json(200, self.server.service.status())
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/evaluate' :
+            return self.send_json(404, {'error': 'NotFound', 'message': 'GET /status or POST /evaluate'})
+        service, start = self.server.service, time.perf_counter()
+        with service.lock :
+            service.in_flight += 1
+        try :
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            store_pa, fields = read_upload(body, self.headers.get_content_type())
+            options = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            result = service.evaluate(store_pa, fields.get('path_pa'), fields.get('seed', options.get('seed')), fields.get('reference', options.get('reference')))
+        except AnalysisError as error :
+            latency = time.perf_counter() - start
+            service.record(latency, failed = True)
+            print(f'REQUEST : {error} ({latency:.3f} s)', flush = True)
+            return self.send_json(400, {'error': error.kind, 'message': error.message, 'latency_s': {'total_s': latency}})
+        except Exception as error : # Unexpected error : reported to the client, the service keeps running
+            latency = time.perf_counter() - start
+            service.record(latency, failed = True)
+            print(f'REQUEST : [{type(error).__name__}] {error} ({latency:.3f} s)', flush = True)
+            return self.send_json(500, {'error': type(error).__name__, 'message': str(error), 'latency_s': {'total_s': latency}})
+        finally :
+            with service.lock :
+                service.in_flight -= 1
+        latency = result['latency_s']
+        service.record(latency['total_s'])
+        source = result['path_pa'] or f'{self.client_address[0]} (upload)'
+        print(f"REQUEST : {result['n_patients']} anonymized patients of {source}, {latency['total_s']:.3f} s "
+              f"(queued {latency['queued_s']:.3f} s, load {latency['load_s']:.3f} s, DTW {latency['dtw_s']:.3f} s, "
+              f"statistics {latency['statistics_s']:.3f} s, tests {latency['tests_s']:.3f} s)", flush = True)
+        self.send_json(200, result)
+
+    def log_message(self, format, *args): # One REQUEST line per evaluation instead of the access log
+        pass
+
+
+def serve(service, host = HOST, port = PORT):
+    """ Answer the requests with one thread each until interrupted (Ctrl-C)
+    Arguments:
+    service = EvaluationService
+    host, port = address of the server (default : local machine only) """
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f'SERVICE : {len(service.store_pr)} original patients loaded in {service.load_s:.2f} s, listening on http://{host}:{server.server_port}/ '
+          f'(POST /evaluate, GET /status) \n', flush = True)
+    try :
+        server.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        server.server_close()
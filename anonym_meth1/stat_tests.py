@@ -0,0 +1,167 @@
+###############################################################################
+# Batched Kolmogorov-Smirnov and Mann-Whitney U tests of the statistical     #
+#  values of part2, for every parameter, statistic and configuration        #
+###############################################################################
+
+# Import libraries
+import sys, os, re
+import multiprocessing, functools
+import numpy as np
+# pandas and scipy are imported by the functions using them, so that the scripts start fast (--help, parsing of the arguments)
+
+from anonym_meth1 import metrics
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.series_stats import STATISTICS
+from anonym_meth1.results_file import results_file, read_results, TEST_COLUMNS
+
+# Files of statistical values written by part2
+STATS_FILE = re.compile(r'^(avg|std|med|min|max)_values_meth1_(FC|PAS|PAM|PAD)_prop-level_(.+)_perturb-level_(.+)\.csv$')
+
+# Multiple-comparison corrections of the results table
+CORRECTIONS = ('holm', 'bonferroni', 'fdr_bh', 'none')
+
+########################################################################################################################################################
+
+def find_stat_files(path_analysis_anonym):
+    """ Return the list of (statistic, param_physio, val_prop, val_perturb, file) of the statistical values files of a folder
+    Argument:
+    path_analysis_anonym = path of an analysis_anonym_meth1 folder """
+
+    found = []
+    for name in sorted(os.listdir(path_analysis_anonym)):
+        match = STATS_FILE.match(name)
+        if match:
+            found.append((*match.groups(), os.path.join(path_analysis_anonym, name)))
+    return found
+
+
+def folder_samples(path_analysis_anonym, columnar = False, param_physio = None, val_prop = None, val_perturb = None):
+    """ Return the list of (statistic, param_physio, val_prop, val_perturb, anonymized values, real values) of a folder, read from its
+    results file when it holds the statistical values and columnar is set (no listing of the folder) or it is newer than the csv files of part2,
+    else from the csv files of part2. Only the files (or arrays) of the requested parameter and configuration are read.
+    Arguments:
+    path_analysis_anonym = path of an analysis_anonym_meth1 folder
+    columnar = read the statistical values of the results file whenever it holds them (--columnar)
+    param_physio, val_prop, val_perturb = only read the values of this parameter / configuration (None : all of them) """
+
+    def wanted(param, prop, perturb):
+        return param_physio in (None, param) and val_prop in (None, prop) and val_perturb in (None, perturb)
+
+    file_results = results_file(path_analysis_anonym)
+    params = [param for param in CHANNELS if param_physio in (None, param)]
+    arrays, metadata = read_results(file_results, {f'{stat}_{role}_{param}' for stat in STATISTICS for role in ('anonym', 'real') for param in params})
+    if arrays:
+        metrics.count('files_read')
+        metrics.count('bytes_read', sum(a.nbytes for a in arrays.values()))
+    samples = [(stat, param, metadata['prop_level'], metadata['perturb_level'], arrays[f'{stat}_anonym_{param}'], arrays[f'{stat}_real_{param}'])
+               for stat, param in sorted((stat, param) for stat in STATISTICS for param in params)
+               if f'{stat}_anonym_{param}' in arrays and wanted(param, metadata['prop_level'], metadata['perturb_level'])]
+    files = [] if (samples and columnar) else [found for found in find_stat_files(path_analysis_anonym) if wanted(*found[1:4])]
+    if samples and not columnar:
+        # Csv files of part2 written after its statistical values (e.g., part2 rerun without --columnar) : they are out of date
+        written = metadata.get('part2', {}).get('time', os.path.getmtime(file_results)) # Later writes of part1 or part3 do not count
+        replaced = {(stat, param, prop, perturb) for stat, param, prop, perturb, _, _ in samples}
+        newer = [file for *key, file in files if tuple(key) in replaced and os.path.getmtime(file) >= written]
+        if not newer:
+            return samples
+        sys.stderr.write(f"[Warning] {file_results} holds statistical values older than {len(newer)} csv files of part2 : the csv files are tested (--columnar tests the results file). \n")
+    elif samples:
+        return samples
+    samples = []
+    import pandas as pd
+    for statistic, param, prop, perturb, file in files:
+        df_read = pd.read_csv(file, usecols = [f'{statistic}_anonym', f'{statistic}_real'])
+        metrics.count('files_read')
+        metrics.count('bytes_read', os.path.getsize(file))
+        samples.append((statistic, param, prop, perturb, df_read[f'{statistic}_anonym'].to_numpy(), df_read[f'{statistic}_real'].to_numpy()))
+    return samples
+
+
+def batched_tests(anonym, real):
+    """ Return the (k, 4) array of KS and Mann-Whitney U results (see TEST_COLUMNS) of k pairs of samples, in one call per test
+    Arguments:
+    anonym = (k, n) array, one sample of anonymized values per row
+    real = (k, m) array, one sample of real values per row """
+
+    from scipy.stats import ks_2samp, mannwhitneyu
+    ks = ks_2samp(anonym, real, axis = 1)
+    wmw = mannwhitneyu(anonym, real, axis = 1) # Unpaired samples, two-sided
+    return np.column_stack((ks.statistic, ks.pvalue, wmw.statistic, wmw.pvalue))
+
+
+def test_folder(path_analysis_anonym, param_physio = None, val_prop = None, val_perturb = None, columnar = False):
+    """ Return the results table (one row per configuration, parameter and statistic) of the statistical values of a folder (see folder_samples).
+    Files of the same sample size are tested together.
+    Arguments:
+    path_analysis_anonym = path of an analysis_anonym_meth1 folder
+    param_physio, val_prop, val_perturb = only read the files of this parameter / configuration (None : all of them)
+    columnar = read the statistical values of the results file whenever it holds them (see folder_samples) """
+
+    import pandas as pd
+    rows, anonym, real = [], [], []
+    with metrics.stage('read_values'):
+        samples = folder_samples(path_analysis_anonym, columnar, param_physio, val_prop, val_perturb)
+    for statistic, param, prop, perturb, values_anonym, values_real in samples:
+        rows.append({'path_analysis_anonym': path_analysis_anonym, 'prop_level': prop, 'perturb_level': perturb,
+                     'param_physio': param, 'statistic': statistic})
+        anonym.append(values_anonym)
+        real.append(values_real)
+
+    results = np.empty((len(rows), len(TEST_COLUMNS)))
+    sizes = np.array([len(a) for a in anonym])
+    with metrics.stage('tests'):
+        for size in np.unique(sizes):
+            group = np.flatnonzero(sizes == size)
+            results[group] = batched_tests(np.array([anonym[i] for i in group]), np.array([real[i] for i in group]))
+    metrics.count('tests', 2 * len(rows))
+    return pd.concat([pd.DataFrame(rows, columns = ['path_analysis_anonym', 'prop_level', 'perturb_level', 'param_physio', 'statistic']),
+                      pd.DataFrame(results, columns = TEST_COLUMNS)], axis = 1)
+
+########################################################################################################################################################
+
+def adjust_pvalues(pvalues, method = 'holm'):
+    """ Return the p-values adjusted for multiple comparisons
+    Arguments:
+    pvalues = 1D array of p-values (one family)
+    method = 'holm' (step-down, family-wise error), 'bonferroni', 'fdr_bh' (Benjamini-Hochberg, false discovery rate) or 'none' """
+
+    pvalues = np.asarray(pvalues, dtype = np.float64)
+    m = len(pvalues)
+    if method == 'none' or m == 0:
+        return pvalues.copy()
+    if method == 'bonferroni':
+        return np.minimum(pvalues * m, 1.0)
+    order = np.argsort(pvalues, kind = 'stable')
+    ranked = pvalues[order]
+    if method == 'holm':
+        adjusted = np.minimum(np.maximum.accumulate(ranked * (m - np.arange(m))), 1.0)
+    elif method == 'fdr_bh':
+        adjusted = np.minimum(np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1], 1.0)
+    else:
+        raise ValueError(f'Unknown correction : {method} (one of {CORRECTIONS})')
+    result = np.empty(m)
+    result[order] = adjusted
+    return result
+
+
+def test_table(folders, workers = 1, correction = 'holm', columnar = False):
+    """ Return the tidy results table of the tests of several analysis folders, with the p-values of all the tests of the table
+    (KS and Mann-Whitney U) adjusted together for multiple comparisons (columns pvalKS_adj, pvalWMW_up_adj)
+    Arguments:
+    folders = list of analysis_anonym_meth1 folders
+    workers = number of processes sharing the folders
+    correction = multiple-comparison correction (see adjust_pvalues)
+    columnar = read the statistical values of the results files whenever they hold them (see folder_samples) """
+
+    import pandas as pd
+    if workers > 1 and len(folders) > 1:
+        with multiprocessing.Pool(min(workers, len(folders))) as pool:
+            tables = pool.map(functools.partial(test_folder, columnar = columnar), folders, chunksize = 1)
+    else:
+        tables = [test_folder(folder, columnar = columnar) for folder in folders]
+    table = pd.concat(tables, ignore_index = True)
+
+    adjusted = adjust_pvalues(np.concatenate((table['pvalKS'].to_numpy(), table['pvalWMW_up'].to_numpy())), correction)
+    table['pvalKS_adj'], table['pvalWMW_up_adj'] = adjusted[:len(table)], adjusted[len(table):]
+    table['correction'] = correction
+    return table
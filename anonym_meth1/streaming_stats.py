@@ -0,0 +1,206 @@
+###############################################################################
+# Out-of-core statistics of series files : chunked reading, parallel-merge   #
+#  mean & standard deviation and median by histogram refinement             #
+###############################################################################
+
+# Import libraries
+import os
+import numpy as np
+# pandas is imported by the functions using it, so that the scripts start fast (--help, parsing of the arguments)
+
+from anonym_meth1 import metrics
+from anonym_meth1.cohort_store import CHANNELS
+from anonym_meth1.series_stats import STATISTICS
+
+# Number of rows of a series file read at once
+CHUNK_SIZE = 65536
+
+# Maximal number of values of a channel kept in memory to select the median (beyond that, the file is read again)
+MEDIAN_BUFFER = 262144
+
+# Number of bins of one refinement pass of the median (12 bits of the 64-bit keys per pass)
+MEDIAN_BINS = 4096
+
+# Modes of the median : exact (bounded-memory selection) or approx (one histogram pass, error bound reported)
+MEDIAN_MODES = ('exact', 'approx')
+
+SIGN_BIT = np.uint64(1 << 63)
+
+########################################################################################################################################################
+
+def read_chunks(file_series, chunk_size = CHUNK_SIZE):
+    """ Yield the successive (rows, 4) float64 arrays (FC, PAS, PAM & PAD columns) of a 'series' file, chunk_size rows at a time
+    Arguments:
+    file_series = path of a 'series' file
+    chunk_size = number of rows per chunk """
+
+    import pandas as pd
+    metrics.count('files_read')
+    metrics.count('bytes_read', os.path.getsize(file_series))
+    with pd.read_csv(file_series, usecols = list(CHANNELS), dtype = np.float64, chunksize = chunk_size) as reader:
+        for df_chunk in reader:
+            yield df_chunk[list(CHANNELS)].to_numpy()
+
+
+def sortable_keys(values):
+    """ Return the uint64 keys of float64 values, in the same order as the values (integers are binned without rounding errors) """
+
+    bits = np.ascontiguousarray(values, dtype = np.float64).view(np.uint64)
+    return np.where(bits & SIGN_BIT, ~bits, bits | SIGN_BIT)
+
+
+def key_values(keys):
+    """ Return the float64 values of uint64 keys (inverse of sortable_keys) """
+
+    keys = np.asarray(keys, dtype = np.uint64)
+    return np.where(keys & SIGN_BIT, keys & ~SIGN_BIT, ~keys).view(np.float64)
+
+########################################################################################################################################################
+
+class RunningStatistics:
+    """ Count, mean, sum of squared deviations, minimum and maximum of each channel, updated chunk by chunk (Chan et al. parallel merge
+    of Welford accumulators : no cancellation of large squared sums). The values are also kept while they fit in buffer_size rows. """
+
+    def __init__(self, n_channels = len(CHANNELS), buffer_size = MEDIAN_BUFFER):
+        self.count = 0
+        self.mean, self.m2 = np.zeros(n_channels), np.zeros(n_channels)
+        self.min, self.max = np.full(n_channels, np.inf), np.full(n_channels, -np.inf)
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def merge(self, count, mean, m2, minimum, maximum):
+        """ Merge the accumulators of another part of the series (count values of mean mean and sum of squared deviations m2) """
+
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min, self.max = np.minimum(self.min, minimum), np.maximum(self.max, maximum)
+
+    def update(self, chunk):
+        """ Add a (rows, n_channels) chunk of values """
+
+        if len(chunk) == 0:
+            return
+        mean = chunk.mean(axis = 0)
+        self.merge(len(chunk), mean, ((chunk - mean) ** 2).sum(axis = 0), chunk.min(axis = 0), chunk.max(axis = 0))
+        if self.buffer is not None:
+            self.buffer = self.buffer + [chunk] if self.count <= self.buffer_size else None # Too long : the median needs more passes
+
+    def std(self):
+        """ Sample standard deviation (n - 1) of each channel, nan for a single value """
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+    def values(self):
+        """ (count, n_channels) array of all the values if they fitted in the buffer, else None """
+
+        return None if self.buffer is None else np.concatenate(self.buffer or [np.empty((0, len(self.mean)))])
+
+########################################################################################################################################################
+
+def select_ranks(file_series, ranks, running, exact = True, chunk_size = CHUNK_SIZE, bins = MEDIAN_BINS, buffer_size = MEDIAN_BUFFER):
+    """ Return ((n_channels, len(ranks)) values of the given ranks of each channel, (n_channels, len(ranks)) error bounds) of a series file
+    too long for the buffer of running. Each pass reads the file once and narrows the interval of keys of every rank to one of bins bins
+    (at most 6 passes for 64-bit keys) ; the values of the last interval are sorted once it holds at most buffer_size of them.
+    Without exact, a single pass is done and the value is the middle of its bin, the error bound being half the width of the bin.
+    Arguments:
+    file_series = path of a 'series' file
+    ranks = 0-based ranks of the sorted values (the same for every channel)
+    running = RunningStatistics of the file (count, minimum and maximum)
+    exact = exact selection, else one histogram pass
+    chunk_size = number of rows read at once
+    bins = number of bins of a pass
+    buffer_size = maximal number of values sorted at the end """
+
+    n_channels = len(running.mean)
+    lo = [[int(k)] * len(ranks) for k in sortable_keys(running.min)]
+    hi = [[int(k)] * len(ranks) for k in sortable_keys(running.max)]
+    below = [[0] * len(ranks) for _ in range(n_channels)]
+    inside = [[running.count] * len(ranks) for _ in range(n_channels)]
+    values, bounds = np.full((n_channels, len(ranks)), np.nan), np.zeros((n_channels, len(ranks)))
+    pending = {(c, r) for c in range(n_channels) for r in range(len(ranks))}
+
+    while pending:
+        collect = {t for t in pending if inside[t[0]][t[1]] <= buffer_size}
+        width = {(c, r): -(-(hi[c][r] - lo[c][r] + 1) // bins) for c, r in pending}
+        parts = {t: [] for t in collect}
+        counts = {t: np.zeros(bins, dtype = np.int64) for t in pending - collect}
+        for chunk in read_chunks(file_series, chunk_size):
+            keys = sortable_keys(chunk)
+            for c, r in pending:
+                k = keys[:, c]
+                k = k[(k >= np.uint64(lo[c][r])) & (k <= np.uint64(hi[c][r]))]
+                if (c, r) in collect:
+                    parts[c, r].append(k)
+                else:
+                    counts[c, r] += np.bincount(((k - np.uint64(lo[c][r])) // np.uint64(width[c, r])).astype(np.intp), minlength = bins)
+
+        done = set(collect)
+        for c, r in collect:
+            values[c, r] = key_values(np.sort(np.concatenate(parts[c, r]))[ranks[r] - below[c][r]])
+        for (c, r), count in counts.items():
+            cumulative = np.cumsum(count)
+            j = int(np.searchsorted(cumulative, ranks[r] - below[c][r], side = 'right')) # Bin of the rank
+            below[c][r] += int(cumulative[j - 1]) if j > 0 else 0
+            lo[c][r], hi[c][r] = lo[c][r] + j * width[c, r], min(lo[c][r] + (j + 1) * width[c, r] - 1, hi[c][r])
+            inside[c][r] = int(count[j])
+            if lo[c][r] == hi[c][r]: # A single key : its value
+                values[c, r] = key_values(lo[c][r])
+                done.add((c, r))
+            elif not exact:
+                low, high = key_values([lo[c][r], hi[c][r]])
+                values[c, r], bounds[c, r] = (low + high) / 2, (high - low) / 2
+                done.add((c, r))
+        pending -= done
+    return values, bounds
+
+
+def file_statistics(file_series, median = 'exact', chunk_size = CHUNK_SIZE, buffer_size = MEDIAN_BUFFER):
+    """ Return ({statistic: array of one value per channel}, array of the error bound of the median of each channel) of a series file,
+    read chunk by chunk : the memory used does not depend on the length of the series. Same definitions as segment_statistics.
+    Arguments:
+    file_series = path of a 'series' file
+    median = 'exact' or 'approx' (see select_ranks), exact anyway when the series fits in the buffer
+    chunk_size = number of rows read at once
+    buffer_size = maximal number of rows kept in memory for the median """
+
+    running = RunningStatistics(buffer_size = buffer_size)
+    for chunk in read_chunks(file_series, chunk_size):
+        running.update(chunk)
+    ranks = [(running.count - 1) // 2, running.count // 2] # Two middle values (the same one for an odd number of values)
+
+    stored = running.values()
+    if running.count == 0:
+        middle, bounds = np.full((len(running.mean), 2), np.nan), np.zeros((len(running.mean), 2))
+    elif stored is not None: # Short series : exact median from the kept values
+        middle, bounds = np.partition(stored, ranks, axis = 0)[ranks].T, np.zeros((stored.shape[1], 2))
+    else:
+        middle, bounds = select_ranks(file_series, ranks, running, median == 'exact', chunk_size, buffer_size = buffer_size)
+
+    mean = running.mean if running.count > 0 else np.full(len(running.mean), np.nan)
+    return {'avg': mean, 'std': running.std(), 'med': middle.mean(axis = 1), 'min': running.min, 'max': running.max}, bounds.mean(axis = 1)
+
+
+def streaming_statistics(files, median = 'exact', chunk_size = CHUNK_SIZE, buffer_size = MEDIAN_BUFFER):
+    """ Return ({statistic: {channel: array of one value per patient}} as cohort_statistics, largest error bound of the medians)
+    of a list of series files, each one read chunk by chunk (see file_statistics)
+    Arguments:
+    files = list of 'series' files, one per patient
+    median = 'exact' or 'approx'
+    chunk_size = number of rows read at once
+    buffer_size = maximal number of rows kept in memory for the median """
+
+    stats = {stat: {c: np.empty(len(files)) for c in CHANNELS} for stat in STATISTICS}
+    max_bound = 0.0
+    for i, file_series in enumerate(files):
+        per_file, bounds = file_statistics(file_series, median, chunk_size, buffer_size)
+        for stat in STATISTICS:
+            for j, c in enumerate(CHANNELS):
+                stats[stat][c][i] = per_file[stat][j]
+        max_bound = max(max_bound, float(bounds.max(initial = 0.0)))
+    return stats, max_bound
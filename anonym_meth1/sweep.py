@@ -0,0 +1,125 @@
+###############################################################################
+#   Sweep of the analysis : part1, part2 and part3 for several anonymized     #
+#  folders (pairs of proportion/perturbation levels) against one original     #
+###############################################################################
+
+# Import libraries
+import os, re, argparse
+import multiprocessing
+import pandas as pd
+from anonym_meth1 import metrics, part1, part2, part3
+from anonym_meth1.errors import AnalysisError
+from anonym_meth1.cohort_store import load_cohort, list_series_files, CHANNELS
+from anonym_meth1.results_file import results_file, read_results
+
+# Names of the folders and files of one configuration (same convention as the example command lines of the README)
+PA_FOLDER = 'gener_simulated_data_meth1_prop-level_{}_perturb-level_{}'
+ANALYSIS_FOLDER = 'analysis_anonym_meth1_prop-level_{}_perturb-level_{}'
+DISTRI_FILE = 'distri_dissim_norm_meth1_prop-level_{}_perturb-level_{}.csv'
+
+# Combined table of normalized dissimilarities of all the configurations (read by boxplot_meth1.R)
+SWEEP_FILE = 'distri_dissim_norm_meth1_sweep.csv'
+
+# Table of the statistical tests of all the configurations (see tests_batch of anonym_meth1.part3)
+TESTS_FILE = 'tests_meth1_sweep.csv'
+
+########################################################################################################################################################
+
+def get_configurations(path_root, props = (), perturbs = (), folders = ()):
+    """ Return the list of configurations (prop-level, perturb-level, anonymized folder, analysis folder), grid first
+    Arguments:
+    path_root = folder containing the anonymized folders of the grid, where the analysis folders are written
+    props, perturbs = proportion and perturbation levels of the grid (strings, e.g. '0.50')
+    folders = other anonymized folders, whose names contain prop-level_<prop>_perturb-level_<perturb> """
+
+    configurations = []
+    for val_prop in props :
+        for val_perturb in perturbs :
+            configurations.append((val_prop, val_perturb, os.path.join(path_root, PA_FOLDER.format(val_prop, val_perturb), '')))
+    for folder in folders :
+        levels = re.search(r'prop-level_([0-9.]+)_perturb-level_([0-9.]+)', os.path.basename(os.path.normpath(folder)))
+        if levels is None :
+            raise AnalysisError('ValueError', f'No prop-level_<prop>_perturb-level_<perturb> in the name of the folder : {folder}')
+        configurations.append((levels.group(1).rstrip('.'), levels.group(2).rstrip('.'), os.path.join(folder, '')))
+    return [(p, q, path_pa, os.path.join(path_root, ANALYSIS_FOLDER.format(p, q), '')) for p, q, path_pa in configurations]
+
+########################################################################################################################################################
+
+def run_configuration(path_pr, configuration, stats_pr, seed, part1_args, columnar = False, parallel = True):
+    """ Run part1, part2 and part3 for one configuration, return the path of its distribution of normalized dissimilarities (csv or results file)
+    Arguments:
+    path_pr = path of the original folder
+    configuration = (prop-level, perturb-level, anonymized folder, analysis folder), see get_configurations
+    stats_pr = statistics of the real patients, computed once for all the configurations (see part2.original_statistics)
+    seed = seed of part1
+    part1_args = options of part1 (parsed arguments of analysis_anonym_meth1_part1.py, the folders and the output file are replaced)
+    columnar = save the results into the results file of the analysis folder (see anonym_meth1.results_file)
+    parallel = use the OpenMP threads of dtaidistance in part1 (False when several configurations run at the same time) """
+
+    val_prop, val_perturb, path_pa, path_analysis_anonym = configuration
+    os.makedirs(path_analysis_anonym, exist_ok = True)
+    filename_csv = DISTRI_FILE.format(val_prop, val_perturb)
+
+    print(f'BEGIN : prop-level {val_prop}, perturb-level {val_perturb} ({path_pa}). \n')
+    args = argparse.Namespace(**dict(vars(part1_args), path_pr = path_pr, path_pa = path_pa, path_analysis_anonym = path_analysis_anonym, filename_csv = filename_csv,
+                                     columnar = part1_args.columnar or columnar))
+    part1.run(args, seed, parallel)
+    part2.calculate_values(path_pr, path_pa, path_analysis_anonym, val_prop, val_perturb, stats_pr, columnar = columnar)
+    for param_physio in CHANNELS :
+        part3.tests_KS_WMW_up(path_analysis_anonym, param_physio, val_prop, val_perturb, columnar)
+    print(f'END OF : prop-level {val_prop}, perturb-level {val_perturb}. \n')
+
+    return results_file(path_analysis_anonym) if columnar else f'{path_analysis_anonym}{filename_csv}'
+
+
+def combine_distributions(path_root, configurations, files_distri):
+    """ Save the normalized dissimilarities of all the configurations into one table (columns prop_level, perturb_level, dissim_norm) and return it
+    Arguments:
+    path_root = folder of the combined table
+    configurations = list of configurations (see get_configurations)
+    files_distri = distribution file of each configuration (csv or results file) """
+
+    tables = []
+    for (val_prop, val_perturb, _, _), file_distri in zip(configurations, files_distri) :
+        dissim_norm = read_results(file_distri)[0]['dissim_norm'] if file_distri.endswith('.npz') else pd.read_csv(file_distri)['dissim_norm']
+        tables.append(pd.DataFrame({'prop_level': val_prop, 'perturb_level': val_perturb, 'dissim_norm': dissim_norm}))
+    table = pd.concat(tables)
+    try :
+        table.to_csv(os.path.join(path_root, SWEEP_FILE), sep = ',', index = False)
+    except IOError :
+        raise AnalysisError('IOError', f'No such file or directory : {path_root}')
+    return table
+
+########################################################################################################################################################
+
+def run_sweep(path_pr, path_root, configurations, seed, part1_args, workers = 1, columnar = False):
+    """ Run part1, part2 and part3 for several configurations against the same original folder, combine their normalized dissimilarities
+    (see combine_distributions) and test them all together (see tests_batch of anonym_meth1.part3), return both tables
+    Arguments:
+    path_pr = path of the original folder
+    path_root = folder of the combined tables (and of the statistics cache of the real patients)
+    configurations = list of configurations (see get_configurations)
+    seed = seed of part1, the same for all the configurations
+    part1_args = options of part1 (see run_configuration)
+    workers = number of configurations run at the same time (each one without the OpenMP threads of dtaidistance when workers > 1)
+    columnar = save the results into the results file of each analysis folder (see anonym_meth1.results_file) """
+
+    # The original folder is loaded (its cohort store built if needed) and summarized once for all the configurations
+    print(f'BEGIN : Load and summarize the original folder for {len(configurations)} configurations. \n')
+    with metrics.stage('original_statistics'):
+        load_cohort(path_pr, list_series_files(path_pr))
+        stats_pr = part2.original_statistics(path_pr, path_root)
+
+    # Several configurations at the same time : one core each, instead of workers x OpenMP threads fighting for the cores
+    jobs = [(path_pr, configuration, stats_pr, seed, part1_args, columnar, workers <= 1) for configuration in configurations]
+    with metrics.stage('configurations'):
+        if workers > 1 : # The counters of the configurations run by the workers stay in their processes
+            with multiprocessing.Pool(min(workers, len(jobs))) as pool:
+                files_distri = pool.starmap(run_configuration, jobs, chunksize = 1)
+        else :
+            files_distri = [run_configuration(*job) for job in jobs]
+
+    table = combine_distributions(path_root, configurations, files_distri)
+    print(f'SWEEP : normalized dissimilarities of the {len(configurations)} configurations saved into {os.path.join(path_root, SWEEP_FILE)} \n')
+    tests = part3.tests_batch([path_analysis_anonym for _, _, _, path_analysis_anonym in configurations], os.path.join(path_root, TESTS_FILE), workers)
+    return table, tests
@@ -0,0 +1,52 @@
+###############################################################################
+# Synthetic cohorts of 'series' files (Time, FC, PAS, PAM, PAD) for the      #
+#  benchmarks of the analysis pipeline                                       #
+###############################################################################
+
+# Import libraries
+import os
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from anonym_meth1.cohort_store import CHANNELS
+
+# Typical level, standard deviation and autocorrelation (AR(1) process) of each physiological parameter
+CHANNEL_MODELS = {'FC': (75.0, 8.0, 0.95), 'PAS': (120.0, 12.0, 0.95), 'PAM': (93.0, 9.0, 0.95), 'PAD': (80.0, 8.0, 0.95)}
+
+########################################################################################################################################################
+
+def synthetic_series(length, rng):
+    """ Return a DataFrame (Time, FC, PAS, PAM, PAD, one decimal as the real files) of one synthetic patient
+    Arguments:
+    length = number of time points
+    rng = numpy random Generator """
+
+    df_series = pd.DataFrame({'Time': np.arange(length)})
+    for c in CHANNELS:
+        level, sd, phi = CHANNEL_MODELS[c]
+        level += rng.normal(0, sd) # Each patient has its own level
+        noise = rng.normal(0, sd * np.sqrt(1 - phi ** 2), length)
+        noise[0] = rng.normal(0, sd) # Stationary start
+        df_series[c] = np.round(level + lfilter([1.0], [1.0, -phi], noise), 1) # values[t] = phi * values[t - 1] + noise[t]
+    return df_series
+
+
+def generate_cohort(path_series, n_patients, length, length_sd = 0.0, seed = 0):
+    """ Write n_patients synthetic '<i>_series.txt' files (i = 1 ... n_patients) into a folder, created if needed, return their paths
+    Arguments:
+    path_series = output folder
+    n_patients = number of patients
+    length = mean number of time points of a series
+    length_sd = standard deviation of the number of time points (0 : all the series have the same length)
+    seed = seed of the cohort """
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(path_series, exist_ok = True)
+    lengths = np.maximum(np.round(rng.normal(length, length_sd, n_patients)), 2).astype(int) if length_sd > 0 else [length] * n_patients
+    files = []
+    for i, n_points in enumerate(lengths, start = 1):
+        file_series = os.path.join(path_series, f'{i}_series.txt')
+        synthetic_series(int(n_points), rng).to_csv(file_series, sep = ',', index = False)
+        files.append(file_series)
+    return files
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+###############################################################################
+#  Benchmark of the analysis pipeline (part1, part2 and part3) on synthetic   #
+#   cohorts of several sizes (number of patients N, series length L)          #
+###############################################################################
+
+# Import libraries
+import sys, os, io, json, time, shutil, platform, argparse, tempfile, contextlib
+from importlib import metadata
+import numpy as np
+from anonym_meth1.cohort_store import load_cohort, list_series_files, CHANNELS, STORE_DIRNAME
+from anonym_meth1.records import records_file
+from anonym_meth1.errors import exit_on_error
+from analysis_anonym_meth1_part1 import seed_value
+
+# Timed steps, in the order of the pipeline
+STEPS = ('load_cohort', 'DTWu_m_minimum', 'normalize_DTWm_min', 'calculate_values', 'tests_KS_WMW_up')
+BENCHMARK_VERSION = 1
+
+
+""" Usage of arguments in bash command line """
+def get_arguments(argv = None):
+    """ Return the parsed arguments of the command line
+    Argument:
+    argv = list of arguments (default : sys.argv[1:]) """
+
+    parser = argparse.ArgumentParser(description = 'Time each step of part1, part2 and part3 on synthetic cohorts of N patients with series of L time points, '
+                                                   'and save the timings as JSON.')
+    parser.add_argument('--patients', type = int, nargs = '+', default = [100], metavar = 'N', help = 'numbers of patients of the original and anonymized cohorts (default : 100)')
+    parser.add_argument('--lengths', type = int, nargs = '+', default = [200], metavar = 'L', help = 'mean numbers of time points of the series (default : 200)')
+    parser.add_argument('--length-sd', type = float, default = 0.0, metavar = 'F', help = 'standard deviation of the series lengths, as a fraction of L (default : 0, same length for all)')
+    parser.add_argument('--repeats', type = int, default = 3, help = 'number of timed runs of each (N, L) (default : 3)')
+    parser.add_argument('--workers', type = int, default = 1, help = 'number of processes of part1 (default : 1)')
+    parser.add_argument('--reference', choices = ['random', 'all', 'screened'], default = 'random', help = 'reference real patients of part1 (default : random)')
+    parser.add_argument('--dtw-mode', choices = ['independent', 'dependent'], default = 'independent', help = 'multivariate DTW of part1 (default : independent)')
+    parser.add_argument('--seed', type = seed_value, default = 0, help = 'seed of the synthetic cohorts and of part1 (default : 0)')
+    parser.add_argument('--output', default = 'benchmark_meth1.json', help = 'JSON file of the timings (default : benchmark_meth1.json)')
+    parser.add_argument('--workdir', default = None, help = 'folder of the synthetic cohorts, kept after the run (default : temporary folder, deleted)')
+    args = parser.parse_args(argv)
+    if min(args.patients) < 10 :
+        parser.error('part1 compares each anonymized patient with 10 real patients : N must be at least 10')
+    return args
+
+########################################################################################################################################################
+
+def timed(function, *args, **kwargs):
+    """ Return the duration in seconds of function(*args, **kwargs), its printed messages being discarded """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - start
+
+
+def environment():
+    """ Return the description of the machine and of the versions of the libraries (saved with the timings) """
+
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            **{library: metadata.version(library) for library in ('numpy', 'pandas', 'scipy', 'dtaidistance')}} # Without importing them
+
+
+def benchmark_size(path_work, n_patients, length, args):
+    """ Generate the original and anonymized cohorts of one size, time every step args.repeats times, return the list of runs
+    Arguments:
+    path_work = folder of the synthetic cohorts
+    n_patients = number of patients of each cohort
+    length = mean number of time points of the series
+    args = parsed arguments (see get_arguments) """
+
+    from anonym_meth1.synthetic import generate_cohort # The pipeline (pandas, scipy, dtaidistance) is only imported once the arguments are parsed
+    from anonym_meth1 import part1, part2, part3
+    path_size = os.path.join(path_work, f'N{n_patients}_L{length}')
+    path_pr, path_pa = os.path.join(path_size, 'original', ''), os.path.join(path_size, 'anonymized', '')
+    path_analysis_anonym, filename_csv = os.path.join(path_size, 'analysis', ''), 'distri_dissim_norm_meth1_benchmark.csv'
+    start = time.perf_counter()
+    generate_cohort(path_pr, n_patients, length, args.length_sd * length, args.seed)
+    generate_cohort(path_pa, n_patients, length, args.length_sd * length, args.seed + 1)
+    print(f'BENCH : cohorts of {n_patients} patients x {length} time points generated in {time.perf_counter() - start:.2f} s')
+
+    runs = []
+    for repeat in range(args.repeats):
+        # Cold run : no cohort store, no records nor statistics of a previous run
+        for path in (path_pr, path_pa):
+            shutil.rmtree(os.path.join(path, STORE_DIRNAME), ignore_errors = True)
+        shutil.rmtree(path_analysis_anonym, ignore_errors = True)
+        os.makedirs(path_analysis_anonym)
+
+        seconds = {}
+        seconds['load_cohort'] = timed(lambda: [load_cohort(path, list_series_files(path)) for path in (path_pr, path_pa)])
+        seconds['DTWu_m_minimum'] = timed(part1.DTWu_m_minimum, path_pr, path_pa, records_file(path_analysis_anonym, filename_csv), args.seed, args.workers, args.reference,
+                                           dtw_mode = args.dtw_mode)
+        seconds['normalize_DTWm_min'] = timed(part1.normalize_DTWm_min, path_analysis_anonym, filename_csv)
+        seconds['calculate_values'] = timed(part2.calculate_values, path_pr, path_pa, path_analysis_anonym, '0.50', '0.05', stats_cache = False)
+        seconds['tests_KS_WMW_up'] = sum(timed(part3.tests_KS_WMW_up, path_analysis_anonym, param_physio, '0.50', '0.05') for param_physio in CHANNELS)
+        runs.append({'n_patients': n_patients, 'length': length, 'repeat': repeat + 1, 'seconds': seconds})
+        print(f'BENCH : N = {n_patients}, L = {length}, run {repeat + 1} : ' + ', '.join(f'{step} {seconds[step]:.3f} s' for step in STEPS))
+    return runs
+
+
+def summarize(runs):
+    """ Return one summary per size (N, L) : median and minimum duration of each step over the repeats
+    Argument:
+    runs = list of runs (see benchmark_size) """
+
+    summary = []
+    for n_patients, length in dict.fromkeys((run['n_patients'], run['length']) for run in runs):
+        timings = [run['seconds'] for run in runs if (run['n_patients'], run['length']) == (n_patients, length)]
+        summary.append({'n_patients': n_patients, 'length': length,
+                        'median_seconds': {step: float(np.median([t[step] for t in timings])) for step in STEPS},
+                        'min_seconds': {step: min(t[step] for t in timings) for step in STEPS}})
+    return summary
+
+########################################################################################################################################################
+
+def main():
+
+    args = get_arguments()
+    path_work = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix = 'benchmark_meth1_')
+    print(f'\nBEGIN : Benchmark of {len(args.patients) * len(args.lengths)} cohort sizes ({args.repeats} runs each) in {path_work}. \n')
+
+    runs = []
+    try :
+        with exit_on_error():
+            for n_patients in args.patients :
+                for length in args.lengths :
+                    runs += benchmark_size(path_work, n_patients, length, args)
+    finally :
+        if args.workdir is None :
+            shutil.rmtree(path_work, ignore_errors = True)
+
+    results = {'benchmark': 'analysis_anonym_meth1', 'version': BENCHMARK_VERSION, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'environment': environment(),
+               'settings': {'patients': args.patients, 'lengths': args.lengths, 'length_sd': args.length_sd, 'repeats': args.repeats,
+                            'workers': args.workers, 'reference': args.reference, 'dtw_mode': args.dtw_mode, 'seed': args.seed},
+               'steps': list(STEPS), 'runs': runs, 'summary': summarize(runs)}
+    try :
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+    except IOError :
+        sys.stderr.write(f"[IOError] No such file or directory : {args.output} \n")
+        exit(1)
+    print(f'\nEND OF : benchmark_meth1.py, timings saved into {args.output}. \n')
+
+if __name__ == '__main__' :
+    main()